@@ -0,0 +1,121 @@
+// Builds the /index charts from the columnar payloads of gantt.chart_payload,
+// the same figures gantt.gantt_figures builds on the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    gantt: {
+        render: function(payload, config) {
+            if (!payload || !config) {
+                return window.dash_clientside.no_update;
+            }
+            if (!payload.rooms.length) {
+                return {
+                    type: "H1",
+                    namespace: "dash_html_components",
+                    props: {children: config.emptyText, className: "text-center text-muted m-4"},
+                };
+            }
+            const pad = (n) => String(n).padStart(2, "0");
+            const axisTime = (minutes) => "1900-01-01 " + pad(Math.floor(minutes / 60)) + ":" + pad(minutes % 60) + ":00";
+            const clockTime = (minutes) => pad(Math.floor(minutes / 60)) + ":" + pad(minutes % 60);
+            const roomName = (room) => room.startsWith("!") ? "<b>" + room.slice(1) + "</b>" : room;
+            const palette = config.palettes[payload.building] || config.palettes["Roomba"];
+
+            const byRoom = payload.rooms.map(() => []);
+            for (let i = 0; i < payload.room.length; i++) {
+                byRoom[payload.room[i]].push({
+                    start: payload.start[i],
+                    finish: payload.finish[i],
+                    weekly: payload.weekly[i],
+                    description: payload.descriptions[payload.description[i]],
+                });
+            }
+
+            const roomTraces = (room, rows, color) => {
+                const weeklyValues = [...new Set(rows.map((row) => row.weekly))];
+                return weeklyValues.map((weekly) => {
+                    const selected = rows.filter((row) => row.weekly === weekly);
+                    const name = room + ", " + (weekly ? "True" : "False");
+                    return {
+                        type: "bar", orientation: "h", name: name, legendgroup: name,
+                        alignmentgroup: "True", offsetgroup: name, showlegend: false, textposition: "auto",
+                        base: selected.map((row) => axisTime(row.start)),
+                        x: selected.map((row) => (row.finish - row.start) * 60000),
+                        y: selected.map(() => room),
+                        customdata: selected.map((row) => [row.description, clockTime(row.start), clockTime(row.finish)]),
+                        hovertemplate: config.hovertemplate,
+                        marker: {color: color, pattern: {shape: config.patternShapes[weekly]}},
+                        xaxis: "x", yaxis: "y",
+                    };
+                });
+            };
+
+            const placeholder = config.placeholder;
+            const graphs = [];
+            for (let i = 0; i < payload.rooms.length; i += config.roomsPerChart) {
+                const indexes = [];
+                for (let j = i; j < Math.min(i + config.roomsPerChart, payload.rooms.length); j++) {
+                    indexes.push(j);
+                }
+                indexes.reverse();
+                const group = indexes.map((j) => payload.rooms[j]);
+                const data = [];
+                indexes.forEach((j, colorIndex) => {
+                    const rows = byRoom[j].length ? byRoom[j] : [{
+                        start: placeholder.start, finish: placeholder.finish,
+                        weekly: placeholder.weekly ? 1 : 0, description: placeholder.description,
+                    }];
+                    data.push(...roomTraces(payload.rooms[j], rows, palette[colorIndex % palette.length]));
+                });
+                const numRooms = group.length;
+                const figure = {data: data, layout: {
+                    template: config.template,
+                    barmode: "overlay",
+                    xaxis: {
+                        type: "date", range: config.xRange, title: {text: ""},
+                        tickmode: "array", tickvals: config.tickvals, ticktext: config.ticktext,
+                    },
+                    yaxis: {
+                        title: {text: ""}, categoryorder: "array", categoryarray: group,
+                        tickvals: group, ticktext: group.map(roomName),
+                    },
+                    showlegend: false,
+                    dragmode: false,
+                    modebar: {remove: config.modebarRemove},
+                    margin: {l: 20, r: 20, t: 40, b: 20},
+                    height: 80 + numRooms * 45 - (numRooms === 1 ? 20 : 0),
+                    shapes: config.slotLines.slice(),
+                }};
+                graphs.push({
+                    type: "Graph",
+                    namespace: "dash_core_components",
+                    props: {figure: figure, style: {"min-width": "900px", "width": "100%"}},
+                });
+            }
+            return graphs;
+        },
+
+        // Marks a building's "gantt-visible" store once its card scrolls into view,
+        // which makes the server send that building's payload
+        observe: function() {
+            setTimeout(() => {
+                if (window.ganttObserver) {
+                    window.ganttObserver.disconnect();
+                }
+                const observer = new IntersectionObserver((entries) => {
+                    entries.forEach((entry) => {
+                        if (!entry.isIntersecting) {
+                            return;
+                        }
+                        observer.unobserve(entry.target);
+                        window.dash_clientside.set_props(
+                            {type: "gantt-visible", index: entry.target.dataset.ganttBuilding},
+                            {data: true},
+                        );
+                    });
+                }, {rootMargin: "200px"});
+                document.querySelectorAll("[data-gantt-building]").forEach((element) => observer.observe(element));
+                window.ganttObserver = observer;
+            });
+            return window.dash_clientside.no_update;
+        },
+    },
+});
@@ -0,0 +1,114 @@
+"""Faculty workbook ingestion: the old pandas cell loop vs the vectorized reader, then diff imports.
+
+    python -m benchmarks.excel_ingest
+
+A synthetic full-faculty workbook is written to a temporary directory and
+imported into an in-memory SQLite database.
+"""
+import random
+import tempfile
+from time import perf_counter
+
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import create_engine
+
+from importer import import_events
+from parse_dfl import BUILDINGS, TIME_SLOTS, REVERSE_WEEKDAYS, read_grid, schedule_events
+from sql import Base
+
+TEACHERS = 250
+FILLED = 0.4
+
+
+def fixture_workbook(path: str, seed=0):
+    rnd = random.Random(seed)
+    workbook = Workbook()
+    sheet = workbook.active
+    rows = [[None] for _ in range(3 + len(TIME_SLOTS) * 2)]
+    rows[0][0] = "Время"
+    for weekday in REVERSE_WEEKDAYS:
+        for teacher in range(TEACHERS):
+            rows[0].append(weekday if teacher == 0 else None)
+            rows[1].append(f"Преподаватель{teacher} Имя{teacher} Отчество{teacher}")
+            rows[2].append("Кафедра")
+            for slot in range(len(TIME_SLOTS)):
+                busy = rnd.random() < FILLED
+                rows[3 + slot * 2].append(f"Группа Б0{rnd.randint(1, 9)}-{rnd.randint(100, 999)}" if busy else None)
+                room = rnd.choice([rnd.randint(100, 520), f"{rnd.randint(1, 30)} НК"])
+                rows[4 + slot * 2].append(room if busy else None)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def legacy_events(path: str):
+    """parse_dfl before the vectorized reader, up to the data frame it wrote to CSV"""
+    data = pd.read_excel(path, header=None)
+    current_day = data.iloc[0, 1]
+    weekdays = {}
+    cur_start = 1
+    for i, value in enumerate(data.iloc[0, 2:].fillna(0), 2):
+        if value:
+            weekdays[current_day] = (cur_start, i-1)
+            current_day = value
+            cur_start = i
+    long_form = []
+    for day in weekdays:
+        daydata = data.iloc[1:, weekdays[day][0]:weekdays[day][1]+1].reset_index(drop=True)
+        title = daydata.iloc[0, :].reset_index(drop=True)
+
+        def shorter_title(x):
+            if pd.isnull(x):
+                return x
+            spl = x.split(' ')
+            if len(spl) < 3:
+                return ' '.join(spl)
+            return spl[0]+' '+spl[1][0]+'.'+spl[2][0]+'.'
+        title_shorter = title.apply(shorter_title)
+        daydata = daydata.iloc[2:, :]
+        for col in range(daydata.shape[1]):
+            for row in range(daydata.shape[0]//2):
+                if pd.isnull(daydata.iloc[row*2, col]):
+                    continue
+                long_form.append(dict(
+                    description=daydata.iloc[row*2, col]+" "+title_shorter[col],
+                    room=daydata.iloc[row*2+1, col],
+                    teacher=title[col],
+                    weekday=day,
+                    slot=row
+                ))
+    df = pd.DataFrame(long_form)
+    df[['start', 'end']] = df['slot'].apply(lambda x: pd.Series(TIME_SLOTS[x]))
+    df['room'] = df["room"].astype(str)
+    df['room'] = df['room'].apply(lambda x: ' '.join([w for w in x.split(' ') if 'НК' not in w]))
+    df['building'] = df['room'].apply(lambda r: ('Квант' if r.isdigit() else 'ЦЯПТ'))
+    df['day'] = df['weekday'].apply(lambda x: REVERSE_WEEKDAYS[x])
+    return len(df)
+
+
+def measure(name, func, describe=str):
+    start = perf_counter()
+    result = func()
+    print(f"{name:<28} {perf_counter() - start:>8.3f} s  {describe(result)}")
+    return result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/schedule.xlsx"
+        fixture_workbook(path)
+        measure("legacy pandas loop", lambda: f"{legacy_events(path)} events")
+        events = measure("vectorized read", lambda: schedule_events(read_grid(path)), lambda res: f"{len(res)} events")
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    scope = {"building": BUILDINGS}
+    measure("first import", lambda: import_events(engine, events, scope, "excel"))
+    measure("re-import, unchanged", lambda: import_events(engine, events, scope, "excel"))
+    changed = [dict(event, description=event["description"] + " (перенос)") if i % 100 == 0 else event
+               for i, event in enumerate(events)]
+    measure("re-import, 1% changed", lambda: import_events(engine, changed, scope, "excel"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Synthetic schedule in a local SQLite database, shared by the benchmarks.
+
+Run benchmarks from the repository root, e.g. `python -m benchmarks.picker_queries`.
+"""
+import random
+from contextlib import contextmanager
+
+from flask import Flask
+from sqlalchemy import event
+
+from sql import DatabaseManager, Events, Room, RoomType, db
+
+# utils and pages need production keys to import, so the constants are repeated here
+BUILDINGS = ['ГК', 'ЛК', 'Квант', 'КПМ', 'Цифра', 'Арктика', 'БК', 'УПМ', 'КМО']
+EQUIPMENT_OPTIONS = [
+    "Маркерная доска", "Меловая доска", "Электронная доска", "Проектор", "Компьютер", "Кондиционер",
+]
+TIME_SLOTS = [
+    ("09:00", "10:25"),
+    ("10:45", "12:10"),
+    ("12:20", "13:45"),
+    ("13:55", "15:20"),
+    ("15:30", "16:55"),
+    ("17:05", "18:30"),
+    ("18:35", "20:00"),
+    ("20:00", "22:00"),
+]
+
+
+def make_dbm(url="sqlite://"):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    return DatabaseManager(app)
+
+
+def seed(dbm: DatabaseManager, rooms_per_building=35, seed=0):
+    """Fill Room and Events: every room gets a random weekly schedule plus some dated events"""
+    rnd = random.Random(seed)
+    with dbm.app.app_context():
+        for building in BUILDINGS:
+            for n in range(rooms_per_building):
+                room = str(100 + n * 3)
+                db.session.add(Room(
+                    building=building, room=room,
+                    room_type=rnd.choice(list(RoomType)), status="free", status_description="",
+                    capacity=rnd.choice([9, 16, 30, 60, 120]),
+                    equipment=",".join(rnd.sample(EQUIPMENT_OPTIONS, rnd.randint(0, 3))),
+                ))
+                for day in range(1, 7):
+                    for start, finish in TIME_SLOTS:
+                        if rnd.random() < 0.5:
+                            continue
+                        description = rnd.choice(["Матан", "Физика", "Алгебра и геометрия", "Английский"])
+                        if rnd.random() < 0.2:
+                            description += " {:02d}.{:02d}".format(rnd.randint(1, 28), rnd.randint(1, 12))
+                        db.session.add(Events(
+                            description=description, building=building, room=room,
+                            time_start=start, time_finish=finish, day=day,
+                        ))
+        db.session.commit()
+
+
+@contextmanager
+def count_queries():
+    """Count SQL statements sent to the database inside the block (needs app context)"""
+    counter = {"queries": 0}
+
+    def before_cursor_execute(*_):
+        counter["queries"] += 1
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,108 @@
+"""Time and payload of the /index charts: the old px.timeline builder, the direct trace builder
+and the columnar payload the browser builds figures from.
+
+    python -m benchmarks.gantt_builders
+"""
+import datetime as dtt
+import json
+from time import perf_counter
+
+import pandas as pd
+import plotly.express as px
+
+from gantt import TIME_SLOTS, ChartRow, chart_rows, chart_payload, gantt_figures, process_room_name
+from benchmarks.fixtures import BUILDINGS, make_dbm, seed
+
+DATE = "2025-03-04"
+REPEATS = 5
+PALETTE = ["#0B2545", "#13315C", "#134074"]
+
+
+def legacy_frame(rows: "list[ChartRow]"):
+    """Data frame filter_events used to return"""
+    day_start = dtt.datetime(1900, 1, 1)
+    df = pd.DataFrame([{
+        'description': row.description, 'building': row.building, 'room': row.room,
+        'time_start': day_start + dtt.timedelta(minutes=row.start),
+        'time_finish': day_start + dtt.timedelta(minutes=row.finish),
+        'stime': row.stime, 'ftime': row.ftime, 'weekly': str(row.weekly),
+    } for row in rows], columns=['description', 'building', 'room', 'time_start', 'time_finish', 'stime', 'ftime', 'weekly'])
+    df['time_start'] = pd.to_datetime(df['time_start'])
+    df['time_finish'] = pd.to_datetime(df['time_finish'])
+    return df
+
+
+def legacy_gantt(df, building, rooms, palette):
+    """generate_gantt_charts before direct traces, minus the retry loop"""
+    df = df[df['building'] == building]
+    if df.empty:
+        return None
+    room_groups = [rooms[i:i + 10] for i in range(0, len(rooms), 10)]
+    figs = []
+    for group in room_groups:
+        df_group = df[df["room"].isin(group)]
+        for room in group:
+            if room not in df_group["room"].values:
+                rdf = pd.Series({
+                    "time_start": dtt.datetime.strptime("07:30", '%H:%M'),
+                    "time_finish": dtt.datetime.strptime("08:30", '%H:%M'),
+                    "description": "NaE", "stime": "07:30", "ftime": "08:30", "weekly": "True", "room": room,
+                })
+                df_group = pd.concat([df_group, rdf.to_frame().T], ignore_index=True)
+        fig = px.timeline(
+            df_group, x_start="time_start", x_end="time_finish", y="room", color="room",
+            custom_data=["description", "stime", "ftime"], labels={"room": "Room"},
+            color_discrete_sequence=palette,
+            range_x=[dtt.datetime.strptime("08:30", '%H:%M'), dtt.datetime.strptime("22:30", '%H:%M')],
+            pattern_shape="weekly", pattern_shape_map={"True": "", "False": "x"},
+            category_orders={"room": group[::-1]},
+        )
+        ticktext = [slot[0] for slot in TIME_SLOTS] + [TIME_SLOTS[-1][1]]
+        fig.update_xaxes(tickmode="array", tickvals=[dtt.datetime.strptime(tick, '%H:%M') for tick in ticktext], ticktext=ticktext)
+        fig.update_yaxes(categoryarray=group[::-1], ticktext=[process_room_name(room) for room in group[::-1]], tickvals=group[::-1])
+        fig.update_traces(hovertemplate="<b>%{y}</b><br>%{customdata[1]} - %{customdata[2]}<br><br>%{customdata[0]}<extra></extra>")
+        fig.update_layout(
+            xaxis_title="", yaxis_title="", showlegend=False, dragmode=False,
+            modebar_remove=["zoom", "pan", "select", "lasso", "zoomIn", "zoomOut", "autoScale", "resetScale"],
+            margin=dict(l=20, r=20, t=40, b=20), height=80 + len(group) * 45 - (20 if len(group) == 1 else 0),
+        )
+        for slot in TIME_SLOTS:
+            for time in slot:
+                fig.add_vline(x=pd.to_datetime(time, format='%H:%M'), line=dict(color="gray", dash="dash", width=1))
+        figs.append(fig)
+    return figs
+
+
+def measure(name, build):
+    """Best of REPEATS over all buildings: ms per building and JSON bytes per building"""
+    best = None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        payload = sum(len(chart.encode()) for building in BUILDINGS for chart in build(building))
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_building = len(BUILDINGS)
+    print(f"{name:<10} {best * 1000 / per_building:>12.1f} {payload / per_building / 1024:>14.1f}")
+
+
+def main():
+    dbm = make_dbm()
+    seed(dbm)
+    with dbm.app.app_context():
+        rows = chart_rows(dbm.get_events(DATE), DATE)
+        rooms = {building: sorted(dbm.get_rooms_gantt(building)) for building in BUILDINGS}
+    df = legacy_frame(rows)
+    print(f"{'builder':<10} {'ms/building':>12} {'KiB/building':>14}")
+    measure("px", lambda building: [
+        fig.to_json() for fig in legacy_gantt(df, building, rooms[building], PALETTE) or []
+    ])
+    measure("direct", lambda building: [
+        json.dumps(fig) for fig in gantt_figures(rows, building, rooms[building], PALETTE) or []
+    ])
+    measure("columnar", lambda building: [
+        json.dumps(chart_payload(rows, building, rooms[building]), ensure_ascii=False)
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Peak memory and time (slowed down by tracemalloc) of reading a large iCal feed: whole tree vs streaming expansion.
+
+    python -m benchmarks.ical_expand
+
+The feed has a year of one-off bookings plus weekly series of a room, as
+booking systems export them; only WEEKS of it matter to the import.
+"""
+import tracemalloc
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from icalendar import Calendar
+
+from ical_additions import calendar_events, current_window, WEEKS
+
+SERIES = 40
+ONE_OFFS = 20000
+
+
+def fixture_feed(week_start: datetime):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//folegle//benchmark//RU"]
+    first = week_start - timedelta(weeks=30)
+    for n in range(SERIES):
+        start = first + timedelta(days=n % 5, hours=9 + n % 8)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:series-{n}@folegle",
+            f"SUMMARY:Семинар {n}",
+            f"DTSTART:{start:%Y%m%dT%H%M%S}",
+            f"DTEND:{start + timedelta(minutes=85):%Y%m%dT%H%M%S}",
+            "RRULE:FREQ=WEEKLY;INTERVAL=1" if n % 3 else "RRULE:FREQ=WEEKLY;INTERVAL=2",
+            "END:VEVENT",
+        ]
+    for n in range(ONE_OFFS):
+        start = first + timedelta(hours=n % 365 * 24 + 8 + n % 12)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:once-{n}@folegle",
+            f"SUMMARY:Бронирование {n}",
+            f"DTSTART:{start:%Y%m%dT%H%M%S}",
+            f"DTEND:{start + timedelta(minutes=45):%Y%m%dT%H%M%S}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines).encode()
+
+
+def measure(name, func, unit):
+    tracemalloc.start()
+    start = perf_counter()
+    result = func()
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:<20} {elapsed:>8.2f} s {peak / 2**20:>8.1f} MiB peak {result:>8} {unit}")
+
+
+def main():
+    week_start, week_end = current_window()
+    body = fixture_feed(week_start.replace(tzinfo=None))
+    print(f"feed {len(body) / 2**20:.1f} MiB, {SERIES} weekly series, {ONE_OFFS} one-offs, {WEEKS} weeks window")
+    measure("whole tree", lambda: len(Calendar.from_ical(body).walk("VEVENT")), "components")
+    measure("streaming", lambda: len(calendar_events("k1", body, week_start, week_end)), "rows")
+
+
+if __name__ == "__main__":
+    main()
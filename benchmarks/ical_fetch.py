@@ -0,0 +1,89 @@
+"""iCal fetch stage against a local HTTP stand-in: one worker vs the pool, then conditional refetch.
+
+    python -m benchmarks.ical_fetch
+
+The server answers every calendar after LATENCY seconds, like a remote
+calendar host, and supports ETag so unchanged calendars come back as 304.
+"""
+import tempfile
+import threading
+import time
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+from ical_additions import fetch_calendars, FETCH_WORKERS
+
+ROOMS = 40
+LATENCY = 0.2
+
+
+def fixture_calendar(room: str):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//folegle//benchmark//RU"]
+    for day in range(1, 6):
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{room}-{day}@folegle",
+            f"SUMMARY:Мероприятие {room} {day}",
+            f"DTSTART:2025030{day}T100000",
+            f"DTEND:2025030{day}T113000",
+            "RRULE:FREQ=WEEKLY;UNTIL=20251231T000000",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines).encode()
+
+
+CALENDARS = {f"k{n}": fixture_calendar(f"k{n}") for n in range(ROOMS)}
+
+
+class CalendarHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        room = self.path.strip("/")
+        body = CALENDARS.get(room)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"' + sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/calendar")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+def measure(name, calendars, cache_dir, workers):
+    start = perf_counter()
+    results = fetch_calendars(calendars, cache_dir=cache_dir, workers=workers)
+    elapsed = perf_counter() - start
+    changed = sum(result.changed for result in results)
+    print(f"{name:<22} {elapsed:>8.2f} s {changed:>8} changed")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CalendarHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/"
+    calendars = {room: base + room for room in CALENDARS}
+    try:
+        with tempfile.TemporaryDirectory() as sequential_dir, tempfile.TemporaryDirectory() as pool_dir:
+            measure("one worker", calendars, sequential_dir, 1)
+            measure(f"{FETCH_WORKERS} workers", calendars, pool_dir, FETCH_WORKERS)
+            measure(f"{FETCH_WORKERS} workers, unchanged", calendars, pool_dir, FETCH_WORKERS)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
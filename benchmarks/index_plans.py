@@ -0,0 +1,91 @@
+"""Query plans and latencies of the hot lookups with and without the indexes added by migrations.
+
+    python -m benchmarks.index_plans [database url]
+
+Defaults to a fresh SQLite file in the temporary directory; pass a MySQL
+url of a scratch database to check the production engine. The tables of
+that database are refilled.
+"""
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import Column, MetaData, Table, text
+
+from sql import Base, db
+from migrations import MIGRATIONS_TABLE, migrate
+from benchmarks.fixtures import make_dbm, seed
+
+# Absolute, so Flask-SQLAlchemy doesn't put it into instance/
+DEFAULT_URL = "sqlite:///" + os.path.join(tempfile.gettempdir(), "benchmark_indexes.db")
+REPEATS = 200
+
+QUERIES = {
+    "events of a room at a weekday": (
+        "SELECT * FROM events WHERE building = :building AND room = :room AND day = :day",
+        {"building": "ГК", "room": "130", "day": 2},
+    ),
+    "room by building and number": (
+        "SELECT * FROM room WHERE building = :building AND room = :room",
+        {"building": "ГК", "room": "130"},
+    ),
+    "counter by name": (
+        "SELECT * FROM counter WHERE name = :name",
+        {"name": "index_page"},
+    ),
+    "session password": (
+        "SELECT * FROM passwords WHERE password_hash = :hash AND expiration_date > CURRENT_TIMESTAMP",
+        {"hash": "0" * 64},
+    ),
+}
+
+
+def explain(conn, sql: str, params: dict):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    return [" | ".join(str(value) for value in row) for row in conn.execute(text(prefix + sql), params)]
+
+
+def report(conn, title: str):
+    print(f"== {title}")
+    for name, (sql, params) in QUERIES.items():
+        start = perf_counter()
+        for _ in range(REPEATS):
+            conn.execute(text(sql), params).all()
+        elapsed = (perf_counter() - start) / REPEATS
+        print(f"{name:<32} {elapsed * 1e6:>10.1f} us")
+        for line in explain(conn, sql, params):
+            print(f"    {line}")
+
+
+def create_old_tables(engine):
+    """Tables of the models with columns only: no indexes or unique constraints, as old databases have them"""
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        Table(table.name, metadata, *[
+            Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+            for column in table.columns
+        ])
+    metadata.create_all(bind=engine)
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_URL
+    dbm = make_dbm(url)
+    with dbm.app.app_context():
+        # Start over from tables as an old database has them, with no record of applied migrations
+        Base.metadata.drop_all(bind=db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {MIGRATIONS_TABLE}"))
+        create_old_tables(db.engine)
+    seed(dbm)
+    with dbm.app.app_context():
+        with db.engine.connect() as conn:
+            report(conn, "before migrations")
+        print("applied:", ", ".join(migrate(db.engine)))
+        with db.engine.connect() as conn:
+            report(conn, "after migrations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Queries per /picker click: the old per-room lookups vs the batched picker query.
+
+    python -m benchmarks.picker_queries
+"""
+from time import perf_counter
+
+from sqlalchemy import select
+
+from sql import Events, Room, db
+from benchmarks.fixtures import make_dbm, seed, count_queries
+
+DATE = "2025-03-04"
+TIME = "11:00"
+
+
+def legacy_picker(dbm, building, room_type, date, time):
+    """Query pattern of get_free_rooms_picker + show_picker_results before batching"""
+    ret_rooms = []
+    for rid, bid in dbm.get_free_rooms(time, date):
+        if building != "any" and building != bid:
+            continue
+        room = db.session.scalars(
+            select(Room)
+            .where(Room.building == bid)
+            .where(Room.room == rid)
+        ).all()[0]
+        if room.room_type.name != room_type:
+            continue
+        ret_rooms.append(room)
+    for room in ret_rooms:
+        # room_status used to load the events of every result
+        db.session.scalars(
+            select(Events)
+            .where(Events.room == room.room)
+            .where(Events.building == room.building)
+        ).all()
+    return ret_rooms
+
+
+def measure(name, func):
+    with count_queries() as counter:
+        start = perf_counter()
+        res = func()
+        elapsed = perf_counter() - start
+    print(f"{name:<24} {counter['queries']:>8} {elapsed * 1000:>10.1f} {len(res):>8}")
+
+
+def main():
+    dbm = make_dbm()
+    seed(dbm)
+    with dbm.app.app_context():
+        dbm.events_snapshot()  # both paths share the snapshot, load it outside of measurements
+        print(f"{'path':<24} {'queries':>8} {'ms':>10} {'rooms':>8}")
+        for room_type in ["lecture", "seminar"]:
+            measure(f"legacy {room_type}", lambda: legacy_picker(dbm, "any", room_type, DATE, TIME))
+            measure(f"batched {room_type}", lambda: dbm.get_free_rooms_picker("any", room_type, DATE, TIME))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import datetime as dtt
+import json
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils import dbm, cache, single_flight, BUILDING_PALETTES, BUILDINGS
+from gantt import render_chart_payload, chart_config
+
+
+# Entries are written by single_flight; bumped from "charts:", which held bare payloads
+CHART_KEY_PREFIX = "charts:v2:"
+CHART_EXPIRE = 60*60*48
+DEFAULT_WARM_DAYS = 7
+# Worker processes building payloads; 0 builds them in the request thread.
+# A payload takes about 1 ms inline and about 2 ms through a pool (the
+# arguments cost more to pickle than to render), so the pool only pays off
+# if building ever gets much heavier than now
+CHART_WORKERS = 0
+CHART_CONFIG = chart_config(BUILDING_PALETTES, "На этот день нет мероприятий")
+
+
+def chart_key(date: str, building: str):
+    return f"{CHART_KEY_PREFIX}{date}:{building}"
+
+
+def chart_inputs(selected_date, building):
+    """Arguments of render_chart_payload, read from the events snapshot (needs app context)"""
+    events = [event for event in dbm.get_events(selected_date) if event.building == building]
+    rooms = sorted(dbm.get_rooms_gantt(building))
+    return events, selected_date, building, rooms
+
+
+def build_chart_payload(selected_date, building):
+    """Columnar events of a building at a date serialized to JSON, "null" if there are no events"""
+    return render_chart_payload(*chart_inputs(selected_date, building))
+
+
+class ChartPool:
+    """Builds chart payloads in worker processes, one computation per key at a time.
+
+    Futures of keys being built are shared, so concurrent requests and the
+    warm-up job of this process wait for the same result; other workers are
+    kept out by single_flight in get_chart_payload. With no workers payloads
+    are built in the calling thread.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: "ProcessPoolExecutor|None" = None
+        self._pending: "dict[str, Future]" = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Forking this process is unsafe once its threads run; workers come from a
+            # clean server process instead and only need gantt, never the app
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["gantt"])
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self._executor
+
+    def _done(self, key: str, future: Future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def forget(self):
+        """Start new computations for keys being built from events that changed since"""
+        with self._lock:
+            self._pending.clear()
+
+    def submit(self, selected_date, building):
+        """Future of the payload JSON of a building at a date (needs app context)"""
+        key = chart_key(selected_date, building)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            return future
+        args = chart_inputs(selected_date, building)
+        if not self.workers:
+            future = Future()
+            future.set_result(render_chart_payload(*args))
+            return future
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            try:
+                future = self._get_executor().submit(render_chart_payload, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory), start over with a new pool
+                self._executor = None
+                future = self._get_executor().submit(render_chart_payload, *args)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._done(key, done))
+        return future
+
+
+chart_pool = ChartPool(CHART_WORKERS)
+
+
+def compute_chart_payload(selected_date, building):
+    # Cached payloads outlive the snapshot check period by far: build them from
+    # the current events, not from a snapshot taken before the last import
+    dbm.events_snapshot(recheck=True)
+    try:
+        return chart_pool.submit(selected_date, building).result()
+    except BrokenProcessPool:
+        return build_chart_payload(selected_date, building)
+
+
+def get_chart_payload(selected_date, building):
+    """Cached columnar events of a building at a date, None if there are no events"""
+    payload = single_flight.get(
+        chart_key(selected_date, building),
+        lambda: compute_chart_payload(selected_date, building),
+        expire=CHART_EXPIRE,
+    )
+    return json.loads(payload)
+
+
+def warm_charts(days=DEFAULT_WARM_DAYS, start: "dtt.date|None" = None, slices: "set[tuple[str, int]]|None" = None):
+    """Build and cache charts of every building, or of (building, weekday) slices, for the next days; return their keys"""
+    start = start or dtt.date.today()
+    futures = {}
+    for offset in range(days):
+        day = start + dtt.timedelta(days=offset)
+        date = day.strftime('%Y-%m-%d')
+        for building in BUILDINGS:
+            if slices is not None and (building, day.weekday() + 1) not in slices:
+                continue
+            futures[chart_key(date, building)] = chart_pool.submit(date, building)
+    for key, future in futures.items():
+        single_flight.store(key, future.result(), expire=CHART_EXPIRE)
+    return set(futures)
+
+
+def invalidate_charts(slices: "set[tuple[str, int]]|None" = None, keep: "set[str]|None" = None):
+    """Drop cached charts of (building, weekday) slices, or all cached charts except keep"""
+    if keep is None:
+        chart_pool.forget()
+    for key in list(cache.iterkeys()):
+        if not isinstance(key, str) or not key.startswith(CHART_KEY_PREFIX):
+            continue
+        if keep and key in keep:
+            continue
+        date, building = key[len(CHART_KEY_PREFIX):].split(":")
+        weekday = dtt.datetime.strptime(date, '%Y-%m-%d').weekday() + 1
+        if slices is None or (building, weekday) in slices:
+            cache.delete(key)
+
+
+dbm.add_events_listener(invalidate_charts)
+
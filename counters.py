@@ -0,0 +1,58 @@
+import atexit
+import threading
+import traceback
+
+
+class CounterBuffer:
+    """Usage counter increments kept in memory and written in batches.
+
+    add() only touches a dict; a background thread hands the accumulated
+    {name: increment} to write every FLUSH_PERIOD seconds, and once more at
+    interpreter exit. Increments of a failed write are put back.
+    """
+    FLUSH_PERIOD = 10
+
+    def __init__(self, write):
+        self.write = write
+        self._pending: "dict[str, int]" = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: "threading.Thread|None" = None
+        self._stop = threading.Event()
+
+    def add(self, name: str, count=1):
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + count
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def flush(self):
+        # One writer at a time, so put-back increments can't overtake newer ones
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self.write(pending)
+            except Exception:
+                with self._lock:
+                    for name, count in pending.items():
+                        self._pending[name] = self._pending.get(name, 0) + count
+                raise
+
+    def _run(self):
+        while not self._stop.wait(self.FLUSH_PERIOD):
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            traceback.print_exc()
@@ -1,3 +1,3 @@
 cd /var/www/u2906537/data/www/folegle.ru
 source /var/www/u2906537/data/www/folegle.ru/.venv/bin/activate
-python /var/www/u2906537/data/www/folegle.ru/ical_additions.py
\ No newline at end of file
+python -m importer ical
\ No newline at end of file
@@ -1,4 +1,9 @@
 from utils import dbm
+from sql import db
+from importer.hooks import sync_room_rows
 
 if __name__ == "__main__":
-    dbm.fill_rooms()
\ No newline at end of file
+    # Imports keep rooms in sync by themselves; this syncs every building at once
+    with dbm.app.app_context():
+        added, removed = sync_room_rows(db.engine)
+        print(f"rooms: {added} added, {removed} removed")
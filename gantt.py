@@ -0,0 +1,201 @@
+import datetime as dtt
+import json
+import re
+from typing import NamedTuple
+
+import plotly.io as pio
+
+from schedule import EventRow, parse_event, datetime_ordinal, time_to_minutes
+
+
+TIME_SLOTS = [
+    ("09:00", "10:25"),
+    ("10:45", "12:10"),
+    ("12:20", "13:45"),
+    ("13:55", "15:20"),
+    ("15:30", "16:55"),
+    ("17:05", "18:30"),
+    ("18:35", "20:00"),
+    ("20:00", "22:00"),
+]
+
+# strptime('%H:%M') puts times at this date, charts use it as the time axis
+DAY_START = dtt.datetime(1900, 1, 1)
+
+ROOMS_PER_CHART = 10
+HOVER_TEMPLATE = "<b>%{y}</b><br>%{customdata[1]} - %{customdata[2]}<br><br>%{customdata[0]}<extra></extra>"
+PATTERN_SHAPES = {True: "", False: "x"}
+MODEBAR_REMOVE = ["zoom", "pan", "select", "lasso", "zoomIn", "zoomOut", "autoScale", "resetScale"]
+
+
+def axis_time(minutes: int):
+    """minutes since midnight -> value on the charts' time axis"""
+    return (DAY_START + dtt.timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def slot_line(minutes: int):
+    """Same shape add_vline makes"""
+    x = axis_time(minutes)
+    return {
+        "type": "line", "x0": x, "x1": x, "xref": "x", "y0": 0, "y1": 1, "yref": "y domain",
+        "line": {"color": "gray", "dash": "dash", "width": 1},
+    }
+
+
+def _template():
+    """Parts of the default plotly template that matter for these charts"""
+    template = pio.templates["plotly"].to_plotly_json()
+    return {
+        "data": {"bar": template["data"]["bar"]},
+        "layout": {
+            key: template["layout"][key]
+            for key in ["font", "hoverlabel", "hovermode", "paper_bgcolor", "plot_bgcolor", "xaxis", "yaxis"]
+        },
+    }
+
+
+TEMPLATE = _template()
+TICK_TEXT = [slot[0] for slot in TIME_SLOTS] + [TIME_SLOTS[-1][1]]
+TICK_VALS = [axis_time(time_to_minutes(tick)) for tick in TICK_TEXT]
+SLOT_LINES = [slot_line(time_to_minutes(time)) for slot in TIME_SLOTS for time in slot]
+X_RANGE = [axis_time(8*60 + 30), axis_time(22*60 + 30)]
+
+
+class ChartRow(NamedTuple):
+    building: str
+    room: str
+    start: int
+    finish: int
+    stime: str
+    ftime: str
+    weekly: bool
+    description: str
+
+
+# Keeps a room on the chart when it has no events at the date; drawn outside of the visible range
+def placeholder_row(building: str, room: str):
+    return ChartRow(building, room, 7*60 + 30, 8*60 + 30, "07:30", "08:30", True, "NaE")
+
+
+def chart_rows(events, date: str):
+    """Events taking place at date, in the form charts need, ordered by building, room and start"""
+    date_to_check = datetime_ordinal(dtt.datetime.strptime(date, '%Y-%m-%d'))
+    rows = []
+    for event in events:
+        parsed = parse_event(event)
+        if not parsed.at_date(date_to_check):
+            continue
+        rows.append(ChartRow(
+            event.building, event.room, parsed.start, parsed.finish, event.time_start, event.time_finish,
+            parsed.weekly, '<br>'.join(re.findall('.{1,30}(?:\\s+|$)', event.description)),
+        ))
+    rows.sort(key=lambda row: (row.building, row.room, row.start))
+    return rows
+
+
+def process_room_name(room_name: str):
+    if room_name.startswith('!'):
+        return f"<b>{room_name[1:]}</b>"
+    return room_name
+
+
+def room_traces(room: str, rows: "list[ChartRow]", color: str):
+    """Bar traces of one room, one per pattern (weekly or not), as plotly JSON"""
+    traces = []
+    for weekly in dict.fromkeys(row.weekly for row in rows):
+        selected = [row for row in rows if row.weekly == weekly]
+        name = f"{room}, {weekly}"
+        traces.append({
+            "type": "bar", "orientation": "h", "name": name, "legendgroup": name,
+            "alignmentgroup": "True", "offsetgroup": name, "showlegend": False, "textposition": "auto",
+            "base": [axis_time(row.start) for row in selected],
+            "x": [(row.finish - row.start) * 60000 for row in selected],
+            "y": [room] * len(selected),
+            "customdata": [[row.description, row.stime, row.ftime] for row in selected],
+            "hovertemplate": HOVER_TEMPLATE,
+            "marker": {"color": color, "pattern": {"shape": PATTERN_SHAPES[weekly]}},
+            "xaxis": "x", "yaxis": "y",
+        })
+    return traces
+
+
+def gantt_figures(rows: "list[ChartRow]", building: str, rooms: "list[str]", palette: "list[str]"):
+    """Figures (plotly JSON dicts) of a building, ROOMS_PER_CHART rooms each; None if there are no events"""
+    by_room: "dict[str, list[ChartRow]]" = {}
+    for row in rows:
+        if row.building == building:
+            by_room.setdefault(row.room, []).append(row)
+    if not by_room:
+        return None
+    figs = []
+    for i in range(0, len(rooms), ROOMS_PER_CHART):
+        group = rooms[i:i + ROOMS_PER_CHART][::-1]
+        data = []
+        for color_index, room in enumerate(group):
+            room_rows = by_room.get(room) or [placeholder_row(building, room)]
+            data.extend(room_traces(room, room_rows, palette[color_index % len(palette)]))
+        num_rooms = len(group)
+        figs.append({"data": data, "layout": {
+            "template": TEMPLATE,
+            "barmode": "overlay",
+            "xaxis": {
+                "type": "date", "range": X_RANGE, "title": {"text": ""},
+                "tickmode": "array", "tickvals": TICK_VALS, "ticktext": TICK_TEXT,
+            },
+            "yaxis": {
+                "title": {"text": ""}, "categoryorder": "array", "categoryarray": group,
+                "tickvals": group, "ticktext": [process_room_name(room) for room in group],
+            },
+            "showlegend": False,
+            "dragmode": False,
+            "modebar": {"remove": MODEBAR_REMOVE},
+            "margin": {"l": 20, "r": 20, "t": 40, "b": 20},
+            "height": 80 + num_rooms * 45 - (20 if num_rooms == 1 else 0),
+            "shapes": SLOT_LINES,
+        }})
+    return figs
+
+
+def chart_payload(rows: "list[ChartRow]", building: str, rooms: "list[str]"):
+    """Columnar events of a building for assets/gantt.js; None if there are no events.
+
+    Rooms and descriptions are sent once and referenced by index, times are minutes.
+    """
+    room_index = {room: i for i, room in enumerate(rooms)}
+    descriptions: "dict[str, int]" = {}
+    payload = {"building": building, "rooms": rooms, "descriptions": [], "room": [], "start": [], "finish": [], "weekly": [], "description": []}
+    for row in rows:
+        if row.building != building:
+            continue
+        payload["room"].append(room_index[row.room])
+        payload["start"].append(row.start)
+        payload["finish"].append(row.finish)
+        payload["weekly"].append(int(row.weekly))
+        payload["description"].append(descriptions.setdefault(row.description, len(descriptions)))
+    if not payload["room"]:
+        return None
+    payload["descriptions"] = list(descriptions)
+    return payload
+
+
+def render_chart_payload(events: "list[EventRow]", date: str, building: str, rooms: "list[str]"):
+    """chart_payload of a building at a date as JSON; pure, so it can run in a worker process"""
+    return json.dumps(chart_payload(chart_rows(events, date), building, rooms), ensure_ascii=False)
+
+
+def chart_config(palettes: "dict[str, list[str]]", empty_text: str):
+    """Everything assets/gantt.js needs besides the payloads, so figures match gantt_figures"""
+    return {
+        "template": TEMPLATE,
+        "palettes": palettes,
+        "roomsPerChart": ROOMS_PER_CHART,
+        "hovertemplate": HOVER_TEMPLATE,
+        "patternShapes": [PATTERN_SHAPES[False], PATTERN_SHAPES[True]],
+        "tickvals": TICK_VALS,
+        "ticktext": TICK_TEXT,
+        "xRange": X_RANGE,
+        "slotLines": SLOT_LINES,
+        "modebarRemove": MODEBAR_REMOVE,
+        "placeholder": placeholder_row("", "")._asdict(),
+        "emptyText": empty_text,
+    }
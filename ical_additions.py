@@ -1,106 +1,294 @@
-from icalendar import Calendar
+from icalendar import Component, vRecur
+from dateutil.rrule import rruleset, rrulestr
 from datetime import datetime, date, timedelta, time, timezone
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from typing import Iterable, NamedTuple
 import requests as rqt
-from sql import Events, Base
-from sqlalchemy import engine as sql_engine, select
-from sqlalchemy.orm import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import io
 import json
+import os
+import sys
+import traceback
 
 WEEKS = 3
-week_start = datetime.combine(date.today() - timedelta(days=date.today().weekday()), time(0, 0), tzinfo=timezone(timedelta(hours=3)))
-week_end = week_start + timedelta(days=7*WEEKS-1)
+BUILDING = "КМО"
+MSK = timezone(timedelta(hours=3))
 
-with open("keys/SQL") as f:
-    sql_url = f.read().strip()
+FETCH_WORKERS = 8
+# (connect, read) seconds per request
+FETCH_TIMEOUT = (5, 30)
+FETCH_RETRIES = 3
+# Last bodies and their ETag/Last-Modified, for conditional requests
+CACHE_DIR = "data/ical_cache"
+STATE_FILE = "state.json"
+CALENDARS_PATH = "data/calendars.json"
 
-with open("data/calendars.json", encoding="utf-8") as f:
-    calendars = json.load(f)
 
-engine = sql_engine.create_engine(sql_url)
-Base.metadata.create_all(engine)
+class FetchResult(NamedTuple):
+    room: str
+    body: bytes
+    changed: bool
+
+
+def current_window(weeks=WEEKS):
+    week_start = datetime.combine(date.today() - timedelta(days=date.today().weekday()), time(0, 0), tzinfo=MSK)
+    return week_start, week_start + timedelta(weeks=weeks)
+
+
+def make_session(workers=FETCH_WORKERS, retries=FETCH_RETRIES):
+    """One connection pool shared by all fetch threads, retrying connection errors and 5xx"""
+    session = rqt.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=Retry(
+        total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    ))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def cache_paths(room: str, cache_dir=CACHE_DIR):
+    name = sha256(room.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, name + ".ics"), os.path.join(cache_dir, name + ".json")
+
+
+def fetch_calendar(session: rqt.Session, room: str, url: str, cache_dir=CACHE_DIR):
+    """Body of the room's calendar; a 304 reply reuses the body stored by the last fetch"""
+    body_path, meta_path = cache_paths(room, cache_dir)
+    meta = {}
+    if os.path.exists(body_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("url") != url:
+            meta = {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        if response.status_code == 304 and meta:
+            with open(body_path, "rb") as f:
+                return FetchResult(room, f.read(), False)
+        response.raise_for_status()
+    except rqt.RequestException:
+        if not meta:
+            raise
+        # Better last known events of the room than none
+        traceback.print_exc()
+        with open(body_path, "rb") as f:
+            return FetchResult(room, f.read(), False)
+    with open(body_path, "wb") as f:
+        f.write(response.content)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }, f)
+    return FetchResult(room, response.content, True)
 
-BUILDING = "КМО"
 
-# Gather events from all iCal calendars
-events_this_week = []
-for room, url in calendars.items():
-    summaries = {}
-    response = rqt.get(url)
-    calendar = Calendar.from_ical(response.content)
-    for component in calendar.walk():
-        if component.name != "VEVENT":
+def fetch_calendars(calendars: "dict[str, str]", cache_dir=CACHE_DIR, workers=FETCH_WORKERS):
+    """Fetch {room: url} concurrently, results in the order of calendars"""
+    os.makedirs(cache_dir, exist_ok=True)
+    with make_session(workers) as session, ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(lambda item: fetch_calendar(session, *item, cache_dir), calendars.items()))
+
+
+class Occurrence(NamedTuple):
+    uid: str
+    summary: str
+    start: datetime
+    finish: datetime
+    # Instance of a recurring event moved or changed by a RECURRENCE-ID component
+    override: bool
+
+
+def to_msk(value: "date|datetime"):
+    """Naive MSK wall time of a DATE or DATE-TIME value; dates are their midnight.
+
+    Moscow has no DST, so recurrences are expanded exactly in MSK wall time.
+    """
+    if not isinstance(value, datetime):
+        return datetime.combine(value, time(0, 0))
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(MSK).replace(tzinfo=None)
+
+
+def iter_components(lines: "Iterable[bytes]"):
+    """VEVENTs of a calendar parsed one at a time, so a big feed is never held as one tree.
+
+    VTIMEZONE blocks are parsed as well: icalendar keeps their zones for the events.
+    """
+    block = None
+    depth = 0
+    for line in lines:
+        line = line.rstrip(b"\r\n")
+        upper = line.upper()
+        if block is None:
+            if upper in (b"BEGIN:VEVENT", b"BEGIN:VTIMEZONE"):
+                block, depth = [line], 1
             continue
-        summary = component.get('summary')
-        start = component.get('dtstart').dt
-        start_date = start.strftime('%d.%m')
-        start_time = start.strftime('%H:%M')
-        if component.get('dtend') is None:
+        block.append(line)
+        if upper.startswith(b"BEGIN:"):
+            depth += 1
+        elif upper.startswith(b"END:"):
+            depth -= 1
+            if depth == 0:
+                component = Component.from_ical(b"\r\n".join(block))
+                block = None
+                if component.name == "VEVENT":
+                    yield component
+
+
+def date_values(component: Component, name: str):
+    """Values of an RDATE/EXDATE property, which may be given several times"""
+    prop = component.get(name)
+    if prop is None:
+        return
+    for values in prop if isinstance(prop, list) else [prop]:
+        for value in values.dts:
+            # RDATE periods are (start, end or duration)
+            yield to_msk(value.dt[0] if isinstance(value.dt, tuple) else value.dt)
+
+
+def occurrence_starts(component: Component, start: datetime, window_start: datetime, window_end: datetime):
+    """Starts of the event's occurrences in [window_start, window_end), expanded lazily"""
+    rules = component.get("rrule")
+    if rules is None and component.get("rdate") is None:
+        if window_start <= start < window_end:
+            yield start
+        return
+    recurrence = rruleset()
+    recurrence.rdate(start)
+    for rule in rules if isinstance(rules, list) else [rules] if rules is not None else []:
+        rule = vRecur(rule)
+        if rule.get("until"):
+            until = rule["until"][0]
+            # A date UNTIL includes that whole day
+            rule["until"] = [to_msk(until) if isinstance(until, datetime) else datetime.combine(until, time(23, 59, 59))]
+        recurrence.rrule(rrulestr(rule.to_ical().decode(), dtstart=start))
+    for value in date_values(component, "rdate"):
+        recurrence.rdate(value)
+    for value in date_values(component, "exdate"):
+        recurrence.exdate(value)
+    for occurrence in recurrence.xafter(window_start, inc=True):
+        if occurrence >= window_end:
+            return
+        yield occurrence
+
+
+def calendar_occurrences(body: bytes, window_start: datetime, window_end: datetime):
+    """Occurrences of the calendar's events in the window, overridden instances left out.
+
+    Only the window's occurrences are kept, so memory follows the window, not the feed.
+    """
+    occurrences = []
+    overridden = set()
+    for component in iter_components(io.BytesIO(body)):
+        if component.get("dtstart") is None:
             continue
-        end = component.get('dtend').dt
-        end_date = end.strftime('%d.%m')
-        end_time = end.strftime('%H:%M')
-        skey = summary+"@"+str(start.weekday()+1)
-        if isinstance(start, date):
-            start = datetime.combine(start, time(0, 0), tzinfo=timezone(timedelta(hours=3)))
-        if not(week_start <= start <= week_end):
-            rr = component.get("rrule")
-            if rr is None:
-                continue
-            until = rr.get("until")
-            if until and isinstance(until[0], date):
-                until[0] = datetime.combine(until[0], time(0, 0), tzinfo=timezone(timedelta(hours=3)))
-            if rr.get("until") and rr.get("until")[0] < week_start:
-                continue
-            event = {
-                "description": " ".join([summary]),
-                "time_start": start_time,
-                "time_finish": end_time,
-                "day": start.weekday()+1,
-                "room": room,
-                "building": BUILDING,
-            }
-            events_this_week.append(event)
+        start = to_msk(component.get("dtstart").dt)
+        if component.get("dtend") is not None:
+            length = to_msk(component.get("dtend").dt) - start
+        elif component.get("duration") is not None:
+            length = component.get("duration").dt
+        else:
             continue
-        if start_date != end_date:
+        uid = str(component.get("uid", ""))
+        recurrence_id = component.get("recurrence-id")
+        if recurrence_id is not None:
+            overridden.add((uid, to_msk(recurrence_id.dt)))
+        if str(component.get("status", "")).upper() == "CANCELLED":
             continue
-        if skey in summaries:
-            event = summaries[skey]
-            event["description"] = " ".join([start_date, event["description"]])
-            if len(event["description"].split(" | ")[0].split(" ")) == WEEKS:
-                try:
-                    event["description"] = event["description"].split(" | ")[1]
-                except IndexError:
-                    print(event["description"])
-                    raise
+        summary = str(component.get("summary", ""))
+        for occurrence in occurrence_starts(component, start, window_start, window_end):
+            occurrences.append(Occurrence(uid, summary, occurrence, occurrence + length, recurrence_id is not None))
+    for occurrence in occurrences:
+        if occurrence.override or (occurrence.uid, occurrence.start) not in overridden:
+            yield occurrence
+
+
+def calendar_events(room: str, body: bytes, week_start: datetime, week_end: datetime):
+    """Events rows of one room's calendar taking place between week_start and week_end (exclusive).
+
+    Occurrences of the same summary at the same weekday and time become one
+    event listing their dates ("DD.MM DD.MM | summary"), or a weekly event
+    with no dates if it takes place every week of the window.
+    """
+    window_start, window_end = to_msk(week_start), to_msk(week_end)
+    weeks = (window_end - window_start).days // 7
+    dates: "dict[tuple[str, int, str, str], set[date]]" = {}
+    for occurrence in calendar_occurrences(body, window_start, window_end):
+        if occurrence.start.date() != occurrence.finish.date():
             continue
-        description = " | ".join([start_date, summary])
-        event = {
+        key = (
+            occurrence.summary,
+            occurrence.start.isoweekday(),
+            occurrence.start.strftime('%H:%M'),
+            occurrence.finish.strftime('%H:%M'),
+        )
+        dates.setdefault(key, set()).add(occurrence.start.date())
+    events = []
+    for (summary, day, time_start, time_finish), days in dates.items():
+        description = summary
+        if len(days) < weeks:
+            description = " | ".join([" ".join(when.strftime('%d.%m') for when in sorted(days)), summary])
+        events.append({
             "description": description,
-            "time_start": start_time,
-            "time_finish": end_time,
-            "day": start.weekday()+1,
+            "time_start": time_start,
+            "time_finish": time_finish,
+            "day": day,
             "room": room,
             "building": BUILDING,
-        }
-        summaries[skey] = event
-        events_this_week.append(event)
-
-# Merge repeating events?
-# If event is repeated its description should list all dates
-# If event repeats every week during the specified period, no date should be listed
-# NOT IMPLEMENTED for now (no repeating events spotted so far)
-
-# with open("data/events.json", "w", encoding="utf-8") as f:
-#     json.dump(events_this_week, f, indent=4, ensure_ascii=False)
-
-with Session(engine) as session:
-    # Remove KMO events from the database
-    kmo_events = session.scalars(select(Events).where(Events.building == BUILDING)).all()
-    for event in kmo_events:
-        session.delete(event)
-    session.commit()
-
-    # Add KMO events from iCal to the database
-    for event in events_this_week:
-        session.add(Events(**event))
-    session.commit()
+        })
+    return events
+
+
+def read_calendars(force=False):
+    """Events of every room calendar in the current window and the state to save once they are stored.
+
+    None if the window and every calendar body are the same as in the saved state, unless force.
+    """
+    with open(CALENDARS_PATH, encoding="utf-8") as f:
+        calendars = json.load(f)
+    week_start, week_end = current_window()
+
+    fetched = fetch_calendars(calendars)
+    # Bodies are cached as soon as they are fetched, imported or not, so the
+    # state compares what was last imported, not what was last fetched
+    state = {
+        "week_start": week_start.isoformat(),
+        "rooms": {result.room: sha256(result.body).hexdigest() for result in fetched},
+    }
+    if not force and load_state() == state:
+        return None
+    events = []
+    for result in fetched:
+        events.extend(calendar_events(result.room, result.body, week_start, week_end))
+    return events, state
+
+
+def load_state(cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: dict, cache_dir=CACHE_DIR):
+    with open(os.path.join(cache_dir, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+if __name__ == "__main__":
+    # Same as python -m importer ical; --force imports even if no calendar changed
+    from importer.cli import main
+    sys.exit(main(["ical", *sys.argv[1:]]))
@@ -0,0 +1,3 @@
+"""Schedule imports: incoming events are diffed against the stored ones and only the difference is written"""
+from importer.diff import EventDiff, diff_events, event_key
+from importer.load import ImportReport, import_events
@@ -0,0 +1,45 @@
+"""Schedule import pipeline.
+
+    python -m importer ical
+    python -m importer excel csv --csv data/extra.csv --dry-run
+
+Every source is read, validated and diffed against the stored events it
+owns, in the buildings it covers: events added by hand or by another
+source are never deleted. Afterwards Room rows are synced and the charts of the changed
+weekdays are rebuilt. Exits with 1 if any source failed.
+"""
+import argparse
+
+from sqlalchemy import create_engine
+
+from sql import Base
+from importer.hooks import SQL_KEY
+from importer.pipeline import print_timings, run
+from importer.sources import SOURCES
+from parse_dfl import SCHEDULE_PATH
+
+
+def parser():
+    res = argparse.ArgumentParser(prog="python -m importer", description="Import schedule sources into the events table.")
+    res.add_argument("sources", nargs="+", choices=sorted(SOURCES), help="sources to import, in order")
+    res.add_argument("--dry-run", action="store_true", help="report the changes without writing them")
+    res.add_argument("--no-hooks", action="store_true", help="skip syncing rooms and rebuilding charts")
+    res.add_argument("--force", action="store_true", help="ical: import even if no calendar changed")
+    res.add_argument("--excel", default=SCHEDULE_PATH, help="excel: workbook path")
+    res.add_argument("--csv", default="data/schedule.csv", help="csv: file path")
+    res.add_argument("--csv-building", action="append",
+                     help="csv: building the file covers (repeatable), buildings in the file by default")
+    res.add_argument("--db", help=f"database url, read from {SQL_KEY} by default")
+    return res
+
+
+def main(argv: "list[str]|None" = None):
+    options = parser().parse_args(argv)
+    if options.db is None:
+        with open(SQL_KEY) as f:
+            options.db = f.read().strip()
+    engine = create_engine(options.db)
+    Base.metadata.create_all(engine)
+    result = run(options.sources, options, engine, dry_run=options.dry_run, hooks=not options.no_hooks)
+    print_timings(result.timings)
+    return 1 if result.failed else 0
@@ -0,0 +1,56 @@
+from typing import Iterable, NamedTuple
+
+from schedule import EventRow, strip_dates
+
+
+def event_key(building: str, room: str, day: int, time_start: str, time_finish: str, description: str):
+    """Natural key of an event: where and when it is and what it is, regardless of its dates.
+
+    An incoming event with the key of a stored one updates it, so a dated
+    event gaining or losing dates stays the same row.
+    """
+    return building, room, day, time_start, time_finish, strip_dates(description).strip()
+
+
+class EventDiff(NamedTuple):
+    """What to do to the stored events so they match incoming ones"""
+    inserts: "list[dict]"
+    updates: "list[dict]"
+    deletes: "list[EventRow]"
+    unchanged: int
+
+    @property
+    def slices(self):
+        """(building, room, weekday) of every changed event"""
+        res = {(event["building"], event["room"], event["day"]) for event in self.inserts + self.updates}
+        res.update((event.building, event.room, event.day) for event in self.deletes)
+        return res
+
+    def __bool__(self):
+        return bool(self.inserts or self.updates or self.deletes)
+
+
+def diff_events(existing: "Iterable[EventRow]", incoming: "Iterable[dict]"):
+    """Diff of stored events against incoming ones (dicts with the Events columns but id)"""
+    by_key: "dict[tuple, list[EventRow]]" = {}
+    for event in sorted(existing, key=lambda event: event.id):
+        key = event_key(event.building, event.room, event.day, event.time_start, event.time_finish, event.description)
+        by_key.setdefault(key, []).append(event)
+    inserts, updates = [], []
+    unchanged = 0
+    for event in incoming:
+        candidates = by_key.get(event_key(
+            event["building"], event["room"], event["day"], event["time_start"], event["time_finish"], event["description"],
+        ))
+        if not candidates:
+            inserts.append(event)
+            continue
+        # Prefer a stored twin with the very same description, then the oldest one
+        match = next((i for i, stored in enumerate(candidates) if stored.description == event["description"]), 0)
+        stored = candidates.pop(match)
+        if stored.description == event["description"]:
+            unchanged += 1
+        else:
+            updates.append({**event, "id": stored.id})
+    deletes = [event for candidates in by_key.values() for event in candidates]
+    return EventDiff(inserts, updates, deletes, unchanged)
@@ -0,0 +1,76 @@
+from sqlalchemy import Engine, make_url, select, insert, delete
+from sqlalchemy.orm import Session
+
+from sql import Events, Room
+from occupancy import room_key
+from importer.load import ImportReport
+
+
+POST_IMPORT_HOOKS = []
+# Database of the app; its caches only describe this one
+SQL_KEY = "keys/SQL"
+
+
+def post_import(func):
+    """Register func(engine, reports) to run after imports that changed events, in order"""
+    POST_IMPORT_HOOKS.append(func)
+    return func
+
+
+def app_database(engine: Engine):
+    """Whether engine points at the app's database"""
+    try:
+        with open(SQL_KEY) as f:
+            url = make_url(f.read().strip())
+    except OSError:
+        return False
+    return url.render_as_string(hide_password=False) == engine.url.render_as_string(hide_password=False)
+
+
+def sync_room_rows(engine: Engine, buildings: "set[str]|None" = None):
+    """Add Room rows for rooms with events, remove those left without any; return (added, removed).
+
+    Rows of rooms that stay keep their status, capacity and equipment.
+    """
+    with Session(engine) as session:
+        events_query = select(Events.building, Events.room).distinct()
+        rooms_query = select(Room.id, Room.building, Room.room)
+        if buildings is not None:
+            events_query = events_query.where(Events.building.in_(buildings))
+            rooms_query = rooms_query.where(Room.building.in_(buildings))
+        wanted = {room_key(building, room) for building, room in session.execute(events_query)}
+        stored = {(building, room): room_id for room_id, building, room in session.execute(rooms_query)}
+        added = sorted(wanted - stored.keys())
+        removed = [stored[key] for key in stored.keys() - wanted]
+        if added:
+            session.execute(insert(Room), [
+                {"building": building, "room": room, "status": "free", "status_description": ""}
+                for building, room in added
+            ])
+        if removed:
+            session.execute(delete(Room).where(Room.id.in_(removed)))
+        session.commit()
+    return len(added), len(removed)
+
+
+@post_import
+def sync_rooms(engine: Engine, reports: "dict[str, ImportReport]"):
+    buildings = {building for report in reports.values() for building, _, _ in report.slices}
+    added, removed = sync_room_rows(engine, buildings)
+    print(f"rooms: {added} added, {removed} removed")
+
+
+@post_import
+def refresh_charts(engine: Engine, reports: "dict[str, ImportReport]"):
+    """Drop cached charts of changed (building, weekday) slices and build the next days' ones again"""
+    if not app_database(engine):
+        print(f"charts: skipped, the app's caches belong to the database in {SQL_KEY}")
+        return
+    # utils needs production keys and builds the app, so only the hook imports it
+    from utils import dbm
+    from charts import warm_charts
+    slices = set().union(*(report.weekday_slices for report in reports.values()))
+    with dbm.app.app_context():
+        dbm.invalidate_events(slices)
+        warmed = warm_charts(slices=slices)
+    print(f"charts: {len(warmed)} rebuilt")
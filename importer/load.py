@@ -0,0 +1,100 @@
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import Engine, select, insert, update, delete, or_
+from sqlalchemy.orm import Session
+
+from sql import Events, bump_events_revision
+from schedule import EventRow
+from importer.diff import EventDiff, diff_events
+
+
+EVENT_COLUMNS = ("description", "building", "room", "time_start", "time_finish", "day")
+DELETE_BATCH = 1000
+
+
+class ImportReport(NamedTuple):
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+    slices: "set[tuple[str, str, int]]"
+
+    @property
+    def weekday_slices(self):
+        """(building, weekday) pairs of slices, what chart and snapshot listeners take"""
+        return {(building, day) for building, _, day in self.slices}
+
+    def __str__(self):
+        return (f"{self.inserted} inserted, {self.updated} updated, {self.deleted} deleted, "
+                f"{self.unchanged} unchanged, {len(self.slices)} room-days changed")
+
+
+def scope_filters(scope: "dict[str, object]"):
+    """WHERE clauses of the stored events a source covers, e.g. {"building": "КМО"} or {"building": [...]}"""
+    filters = []
+    for column, value in scope.items():
+        attribute = getattr(Events, column)
+        filters.append(attribute.in_(value) if isinstance(value, (list, tuple, set)) else attribute == value)
+    return filters
+
+
+def in_scope(event: dict, scope: "dict[str, object]"):
+    for column, value in scope.items():
+        if isinstance(value, (list, tuple, set)):
+            if event[column] not in value:
+                return False
+        elif event[column] != value:
+            return False
+    return True
+
+
+def owned_diff(diff: EventDiff, owners: "dict[int, str|None]", source: str):
+    """diff without deleting events source doesn't own, and the unowned events it matched, to take over"""
+    touched = {event["id"] for event in diff.updates} | {event.id for event in diff.deletes}
+    adopted = [event_id for event_id, owner in owners.items() if owner is None and event_id not in touched]
+    return diff._replace(deletes=[event for event in diff.deletes if owners[event.id] == source]), adopted
+
+
+def apply_diff(session: Session, diff: EventDiff, source: str, adopted: "list[int]"):
+    if diff.inserts:
+        session.execute(insert(Events), [
+            {**{column: event[column] for column in EVENT_COLUMNS}, "source": source} for event in diff.inserts
+        ])
+    if diff.updates:
+        # Bulk UPDATE by primary key
+        session.execute(update(Events), [{**event, "source": source} for event in diff.updates])
+    for i in range(0, len(adopted), DELETE_BATCH):
+        session.execute(update(Events).where(Events.id.in_(adopted[i:i + DELETE_BATCH])).values(source=source))
+    ids = [event.id for event in diff.deletes]
+    for i in range(0, len(ids), DELETE_BATCH):
+        session.execute(delete(Events).where(Events.id.in_(ids[i:i + DELETE_BATCH])))
+    bump_events_revision(session)
+
+
+def import_events(engine: Engine, incoming: "Iterable[dict]", scope: "dict[str, object]", source: str, dry_run=False):
+    """Make the stored events of source in scope equal to incoming, in one transaction.
+
+    Only the difference is written, so untouched rows keep their ids and
+    users never see the scope half-imported. Events of other sources are left
+    alone; events without a source (added by hand or imported before sources
+    were recorded) are taken over when incoming ones match them and kept
+    otherwise, so an import never deletes what it didn't insert.
+    """
+    incoming = list(incoming)
+    outside = [event for event in incoming if not in_scope(event, scope)]
+    if outside:
+        raise ValueError(f"{len(outside)} incoming events are outside of {scope}, e.g. {outside[0]}")
+    with Session(engine) as session:
+        existing, owners = [], {}
+        for owner, *row in session.execute(
+            select(Events.source, Events.id, Events.description, Events.building, Events.room,
+                   Events.time_start, Events.time_finish, Events.day)
+            .where(*scope_filters(scope), or_(Events.source.is_(None), Events.source == source))
+        ):
+            existing.append(EventRow(*row))
+            owners[row[0]] = owner
+        diff, adopted = owned_diff(diff_events(existing, incoming), owners, source)
+        if (diff or adopted) and not dry_run:
+            apply_diff(session, diff, source, adopted)
+            session.commit()
+    return ImportReport(len(diff.inserts), len(diff.updates), len(diff.deletes), diff.unchanged, diff.slices)
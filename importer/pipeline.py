@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+import traceback
+from time import perf_counter
+from typing import NamedTuple
+
+from sqlalchemy import Engine
+
+from importer.hooks import POST_IMPORT_HOOKS
+from importer.load import ImportReport, import_events
+from importer.sources import SOURCES
+from importer.validate import stage_events
+
+# Problems printed per rejected source
+MAX_PROBLEMS = 20
+
+
+class Timing(NamedTuple):
+    name: str
+    stage: str
+    seconds: float
+
+
+class PipelineResult(NamedTuple):
+    reports: "dict[str, ImportReport]"
+    failed: "list[str]"
+    timings: "list[Timing]"
+
+
+@contextmanager
+def timed(timings: "list[Timing]", name: str, stage: str):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.append(Timing(name, stage, perf_counter() - start))
+
+
+def run(names: "list[str]", options, engine: Engine, dry_run=False, hooks=True):
+    """Read, stage, validate and load every source in turn, then run post-import hooks if events changed.
+
+    A source with invalid events is not loaded at all, so a broken feed can't
+    wipe the events it owns; the others still are. Stored events are owned
+    by the source that inserted them and only it deletes them.
+    """
+    reports: "dict[str, ImportReport]" = {}
+    failed = []
+    timings: "list[Timing]" = []
+    for name in names:
+        try:
+            with timed(timings, name, "read"):
+                batch = SOURCES[name](options)
+        except Exception as e:
+            print(f"{name}: reading failed: {e!r}")
+            failed.append(name)
+            continue
+        if batch is None:
+            print(f"{name}: unchanged since the last import")
+            continue
+        with timed(timings, name, "validate"):
+            staged = stage_events(batch.events, batch.scope)
+        if staged.problems:
+            print(f"{name}: {len(staged.problems)} invalid events, nothing loaded")
+            for problem in staged.problems[:MAX_PROBLEMS]:
+                print(f"    {problem}")
+            failed.append(name)
+            continue
+        if staged.duplicates:
+            print(f"{name}: {staged.duplicates} duplicate events dropped")
+        with timed(timings, name, "load"):
+            report = import_events(engine, staged.events, batch.scope, batch.owner or name, dry_run=dry_run)
+        print(f"{name}: {report}{' (dry run, nothing written)' if dry_run else ''}")
+        if dry_run:
+            continue
+        reports[name] = report
+        if batch.on_loaded is not None:
+            batch.on_loaded()
+    changed = {name: report for name, report in reports.items() if report.slices}
+    if hooks and changed:
+        for hook in POST_IMPORT_HOOKS:
+            # Events are already stored: report a failed hook and go on with the rest
+            try:
+                with timed(timings, "post-import", hook.__name__):
+                    hook(engine, changed)
+            except Exception:
+                traceback.print_exc()
+                print(f"post-import {hook.__name__} failed")
+                failed.append(f"post-import {hook.__name__}")
+    return PipelineResult(reports, failed, timings)
+
+
+def print_timings(timings: "list[Timing]"):
+    for timing in timings:
+        print(f"{timing.name:<12} {timing.stage:<16} {timing.seconds:>8.3f} s")
+    print(f"{'total':<29} {sum(timing.seconds for timing in timings):>8.3f} s")
@@ -0,0 +1,53 @@
+import csv
+import os
+from typing import Callable, NamedTuple
+
+
+class Batch(NamedTuple):
+    """Events read from a source and where the stored events they replace are"""
+    scope: "dict[str, object]"
+    events: "list[dict]"
+    # Called once the events are stored, e.g. to remember what was fetched
+    on_loaded: "Callable[[], None]|None" = None
+    # Events.source of the stored events; the source's name if None
+    owner: "str|None" = None
+
+
+SOURCES: "dict[str, Callable]" = {}
+
+
+def source(name: str):
+    """Register func(options) -> Batch|None as a source; None means nothing changed since the last import"""
+    def register(func):
+        SOURCES[name] = func
+        return func
+    return register
+
+
+@source("ical")
+def ical_source(options):
+    from ical_additions import BUILDING, read_calendars, save_state
+    read = read_calendars(force=options.force)
+    if read is None:
+        return None
+    events, state = read
+    return Batch({"building": BUILDING}, events, lambda: save_state(state))
+
+
+@source("excel")
+def excel_source(options):
+    from parse_dfl import BUILDINGS, read_grid, schedule_events
+    return Batch({"building": BUILDINGS}, schedule_events(read_grid(options.excel)))
+
+
+@source("csv")
+def csv_source(options):
+    """Events columns with a header row, as parse_dfl used to write them.
+
+    Replaces the events an earlier import of the same file name stored in the
+    buildings of the file.
+    """
+    with open(options.csv, encoding="utf-8", newline="") as f:
+        events = list(csv.DictReader(f))
+    buildings = options.csv_building or sorted({event.get("building") or "" for event in events})
+    return Batch({"building": buildings}, events, owner=f"csv:{os.path.basename(options.csv)}")
@@ -0,0 +1,76 @@
+import re
+from typing import Iterable, NamedTuple
+
+from importer.load import EVENT_COLUMNS, in_scope
+from schedule import time_to_minutes
+
+TIME_PATTERN = re.compile(r"\d{1,2}:\d{2}")
+
+
+class Problem(NamedTuple):
+    index: int
+    reason: str
+    event: dict
+
+    def __str__(self):
+        return f"#{self.index}: {self.reason}: {self.event}"
+
+
+class Staged(NamedTuple):
+    """Normalized events ready to load, or the problems that keep them from loading"""
+    events: "list[dict]"
+    duplicates: int
+    problems: "list[Problem]"
+
+
+def normalize(event: dict):
+    """Event with only the Events columns, strings stripped, times as HH:MM and the weekday an int"""
+    res = {column: event.get(column) for column in EVENT_COLUMNS}
+    for column in ("description", "building", "room", "time_start", "time_finish"):
+        if res[column] is not None:
+            res[column] = str(res[column]).strip()
+    for column in ("time_start", "time_finish"):
+        if res[column] and TIME_PATTERN.fullmatch(res[column]):
+            res[column] = res[column].zfill(5)
+    try:
+        res["day"] = int(res["day"])
+    except (TypeError, ValueError):
+        pass
+    return res
+
+
+def check(event: dict, scope: "dict[str, object]"):
+    """Why the normalized event can't be loaded, None if it can"""
+    for column in ("description", "building", "room"):
+        if event[column] is None or (column != "description" and not event[column]):
+            return f"no {column}"
+    if not isinstance(event["day"], int) or not 1 <= event["day"] <= 7:
+        return "weekday is not 1-7"
+    for column in ("time_start", "time_finish"):
+        if not event[column] or not TIME_PATTERN.fullmatch(event[column]) or time_to_minutes(event[column]) >= 24 * 60:
+            return f"{column} is not HH:MM"
+    if time_to_minutes(event["time_start"]) >= time_to_minutes(event["time_finish"]):
+        return "finishes before it starts"
+    if not in_scope(event, scope):
+        return "outside of the source's scope"
+    return None
+
+
+def stage_events(events: "Iterable[dict]", scope: "dict[str, object]"):
+    """Normalize and check a source's events; exact duplicates are dropped, any problem rejects the batch"""
+    staged, problems = [], []
+    seen = set()
+    duplicates = 0
+    for index, event in enumerate(events):
+        event = normalize(event)
+        reason = check(event, scope)
+        if reason is not None:
+            problems.append(Problem(index, reason, event))
+            continue
+        key = tuple(event[column] for column in EVENT_COLUMNS)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        staged.append(event)
+    return Staged(staged, duplicates, problems)
@@ -8,7 +8,7 @@ import datetime as dtt
 from sendemail import send_email
 import requests
 import traceback
-from utils import track_usage, server, dbm, WEEKDAYS
+from utils import track_usage, server, dbm, metrics, WEEKDAYS
 from new_features import new_features
 import sys
 
@@ -108,6 +108,7 @@ def push_log(msg):
 
 
 dbm.logf = push_log
+dbm.start_password_cleanup()
 
 clientside_callback(
     """
@@ -363,6 +364,22 @@ def get_counters():
     return jsonify({"status": "success", "counters": {k: v for k, v in counters}})
 
 
+@server.route('/get_metrics')
+def get_metrics():
+    if not dbm.verify_password(request.cookies.get('password')) and not IS_DEBUG:
+        return redirect(url_for('request_password'))
+    return jsonify({"status": "success", "metrics": metrics.as_json()})
+
+
+@server.route('/metrics')
+def prometheus_metrics():
+    if not dbm.verify_password(request.cookies.get('password')) and not IS_DEBUG:
+        return redirect(url_for('request_password'))
+    response = make_response(metrics.as_prometheus())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
 # Run the app
 if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == "-d":
@@ -0,0 +1,152 @@
+import threading
+import time
+from datetime import datetime
+
+
+# Upper bounds of latency histogram buckets, seconds; the last bucket is +Inf
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Series:
+    """Count, total and histogram of latencies of one name in one time bucket"""
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other: "Series"):
+        self.count += other.count
+        self.total += other.total
+        for i, value in enumerate(other.buckets):
+            self.buckets[i] += value
+
+    def as_dict(self):
+        return {"count": self.count, "sum": round(self.total, 6), "buckets": list(self.buckets)}
+
+
+class Metrics:
+    """Per-name counts and latency histograms in minute and hour buckets, since process start.
+
+    Every thread records into its own store, so observing takes a lock nobody
+    else holds except a reader merging the stores. Numbers are per worker
+    process.
+    """
+    MINUTES_KEPT = 120
+    HOURS_KEPT = 48
+    PERIODS = {"minute": 60, "hour": 3600}
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stores: "list[dict]" = []
+        self._stores_lock = threading.Lock()
+        # Stores of finished threads are merged here, so short-lived request threads don't pile up
+        self._retired = self._new_store()
+        self._minute = None
+
+    @staticmethod
+    def _new_store():
+        return {"lock": threading.Lock(), "series": {}, "thread": threading.current_thread()}
+
+    def _store(self):
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = self._new_store()
+            with self._stores_lock:
+                self._stores.append(store)
+        return store
+
+    def observe(self, name: str, seconds: float, now: "float|None" = None):
+        now = time.time() if now is None else now
+        minute = int(now // 60)
+        if minute != self._minute:
+            # Once a minute, so memory stays bounded even if nobody reads the metrics
+            self._minute = minute
+            self._maintain(now)
+        store = self._store()
+        with store["lock"]:
+            series = store["series"]
+            for period, length in self.PERIODS.items():
+                key = (period, int(now // length), name)
+                if key not in series:
+                    series[key] = Series()
+                series[key].observe(seconds)
+            total_key = ("total", 0, name)
+            if total_key not in series:
+                series[total_key] = Series()
+            series[total_key].observe(seconds)
+
+    def _maintain(self, now: float):
+        """Fold stores of finished threads into the retired one and drop old buckets; return the stores"""
+        oldest = {
+            "minute": int(now // 60) - self.MINUTES_KEPT,
+            "hour": int(now // 3600) - self.HOURS_KEPT,
+        }
+        with self._stores_lock:
+            finished = [store for store in self._stores if not store["thread"].is_alive()]
+            self._stores = [store for store in self._stores if store["thread"].is_alive()]
+            stores = self._stores + [self._retired]
+        with self._retired["lock"]:
+            for store in finished:
+                for key, value in store["series"].items():
+                    self._retired["series"].setdefault(key, Series()).merge(value)
+        for store in stores:
+            with store["lock"]:
+                series = store["series"]
+                for key in [key for key in series if key[0] in oldest and key[1] < oldest[key[0]]]:
+                    del series[key]
+        return stores
+
+    def _collect(self):
+        """Merge thread stores into {(period, bucket, name): Series}"""
+        merged: "dict[tuple[str, int, str], Series]" = {}
+        for store in self._maintain(time.time()):
+            with store["lock"]:
+                for key, value in store["series"].items():
+                    merged.setdefault(key, Series()).merge(value)
+        return merged
+
+    def as_json(self):
+        """{"buckets": LATENCY_BUCKETS, "minute"/"hour": {start: {name: series}}, "total": {name: series}}"""
+        res = {"buckets": LATENCY_BUCKETS, "minute": {}, "hour": {}, "total": {}}
+        for (period, bucket, name), series in sorted(self._collect().items()):
+            if period == "total":
+                res["total"][name] = series.as_dict()
+                continue
+            start = datetime.fromtimestamp(bucket * self.PERIODS[period]).strftime('%Y-%m-%d %H:%M')
+            res[period].setdefault(start, {})[name] = series.as_dict()
+        return res
+
+    def as_prometheus(self, prefix="folegle"):
+        """Totals since process start in Prometheus text format"""
+        lines = [
+            f"# HELP {prefix}_calls_total Tracked calls by name.",
+            f"# TYPE {prefix}_calls_total counter",
+        ]
+        totals = sorted(
+            (name, series) for (period, _, name), series in self._collect().items() if period == "total"
+        )
+        for name, series in totals:
+            lines.append(f'{prefix}_calls_total{{name="{name}"}} {series.count}')
+        lines += [
+            f"# HELP {prefix}_latency_seconds Latency of tracked calls by name.",
+            f"# TYPE {prefix}_latency_seconds histogram",
+        ]
+        for name, series in totals:
+            cumulative = 0
+            for bound, value in zip(LATENCY_BUCKETS + ["+Inf"], series.buckets):
+                cumulative += value
+                lines.append(f'{prefix}_latency_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_latency_seconds_sum{{name="{name}"}} {series.total}')
+            lines.append(f'{prefix}_latency_seconds_count{{name="{name}"}} {series.count}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,181 @@
+"""Schema changes of existing databases.
+
+db.create_all only creates missing tables, so columns and indexes added to
+the models later are brought to old databases here. Every migration runs
+once per database (applied names are kept in schema_migrations) and checks
+the schema before changing it, so a database created from the current
+models, or changed by hand, passes through unharmed. Workers starting
+together take turns on a MySQL named lock, so each step runs once.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import sqlalchemy.exc as sae
+from sqlalchemy import Engine, inspect, text, select, update, delete, func, table, column
+
+
+MIGRATIONS_TABLE = "schema_migrations"
+MIGRATIONS = []
+
+# Longest prefix of a TEXT column MySQL indexes with 4-byte characters
+MYSQL_PREFIX = 191
+# Seconds a starting worker waits for another one's migrations
+LOCK_TIMEOUT = 120
+# MySQL error codes
+ER_DUP_KEYNAME = 1061
+ER_BLOB_KEY_WITHOUT_LENGTH = 1170
+
+
+def migration(step):
+    """Register step(engine) as the next migration, named after the function"""
+    MIGRATIONS.append(step)
+    return step
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """Keep workers starting together from migrating at the same time.
+
+    MySQL gets a named lock held by one connection for the whole run; SQLite
+    databases here belong to a single process.
+    """
+    if engine.dialect.name != "mysql":
+        yield
+        return
+    with engine.connect() as conn:
+        if conn.scalar(text("SELECT GET_LOCK(:name, :timeout)"), {"name": MIGRATIONS_TABLE, "timeout": LOCK_TIMEOUT}) != 1:
+            raise RuntimeError(f"Could not lock {MIGRATIONS_TABLE} in {LOCK_TIMEOUT} seconds")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATIONS_TABLE})
+
+
+def applied_migrations(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (name VARCHAR(100) PRIMARY KEY, applied_at DATETIME)"
+        ))
+        return set(conn.scalars(text(f"SELECT name FROM {MIGRATIONS_TABLE}")).all())
+
+
+def migrate(engine: Engine):
+    """Apply migrations not yet applied to the database, return their names"""
+    applied = applied_migrations(engine)
+    if all(step.__name__ in applied for step in MIGRATIONS):
+        return []
+    done = []
+    with migration_lock(engine):
+        # Another worker could have applied them while we waited for the lock
+        applied = applied_migrations(engine)
+        for step in MIGRATIONS:
+            if step.__name__ in applied:
+                continue
+            step(engine)
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"INSERT INTO {MIGRATIONS_TABLE} (name, applied_at) VALUES (:name, :applied_at)"),
+                    {"name": step.__name__, "applied_at": datetime.now()},
+                )
+            done.append(step.__name__)
+    return done
+
+
+def mysql_error_code(error: sae.DBAPIError):
+    args = getattr(error.orig, "args", ())
+    return args[0] if args and isinstance(args[0], int) else None
+
+
+def add_column(engine: Engine, table_name: str, column_name: str, definition: str):
+    if column_name in {col["name"] for col in inspect(engine).get_columns(table_name)}:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}"))
+
+
+def create_index(engine: Engine, name: str, table_name: str, columns: "list[str]", unique=False):
+    """Create an index unless the columns are already indexed that way"""
+    inspector = inspect(engine)
+    indexed = [index["column_names"] for index in inspector.get_indexes(table_name) if index["unique"] or not unique]
+    if unique:
+        indexed += [constraint["column_names"] for constraint in inspector.get_unique_constraints(table_name)]
+    if columns in indexed:
+        return
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE {kind} {name} ON {table_name} ({', '.join(columns)})"))
+    except sae.DBAPIError as e:
+        if engine.dialect.name != "mysql":
+            raise
+        code = mysql_error_code(e)
+        if code == ER_DUP_KEYNAME:
+            return  # the index is there, made by hand or by the models
+        if code != ER_BLOB_KEY_WITHOUT_LENGTH:
+            raise
+        # MySQL can't index TEXT columns without a prefix length
+        types = {col["name"]: col["type"] for col in inspector.get_columns(table_name)}
+        parts = [
+            f"{col_name}({MYSQL_PREFIX})" if types[col_name].python_type is str else col_name
+            for col_name in columns
+        ]
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE {kind} {name} ON {table_name} ({', '.join(parts)})"))
+
+
+def drop_duplicates(engine: Engine, table_name: str, columns: "list[str]", merge_sum: "str|None" = None):
+    """Keep the first row (lowest id) of every group of rows equal on columns; sum merge_sum into it"""
+    rows = table(table_name, column("id"), *[column(name) for name in columns],
+                 *([column(merge_sum)] if merge_sum else []))
+    keys = [rows.c[name] for name in columns]
+    aggregates = [func.min(rows.c.id)] + ([func.sum(rows.c[merge_sum])] if merge_sum else [])
+    with engine.begin() as conn:
+        duplicates = conn.execute(select(*keys, *aggregates).group_by(*keys).having(func.count() > 1)).all()
+        for duplicate in duplicates:
+            values = duplicate[:len(columns)]
+            keep_id = duplicate[len(columns)]
+            if merge_sum:
+                conn.execute(update(rows).where(rows.c.id == keep_id).values({merge_sum: duplicate[-1]}))
+            same = [key == value for key, value in zip(keys, values)]
+            conn.execute(delete(rows).where(*same).where(rows.c.id != keep_id))
+
+
+@migration
+def room_marked_until(engine: Engine):
+    add_column(engine, "room", "marked_until", "DATETIME NULL")
+
+
+@migration
+def counter_unique_name(engine: Engine):
+    # Counter upserts need a unique name
+    drop_duplicates(engine, "counter", ["name"], merge_sum="count")
+    create_index(engine, "uq_counter_name", "counter", ["name"], unique=True)
+
+
+@migration
+def passwords_indexes(engine: Engine):
+    create_index(engine, "ix_passwords_password_hash", "passwords", ["password_hash"])
+    create_index(engine, "ix_passwords_expiration_date", "passwords", ["expiration_date"])
+
+
+@migration
+def events_building_room_day(engine: Engine):
+    create_index(engine, "ix_events_building_room_day", "events", ["building", "room", "day"])
+
+
+@migration
+def room_unique_building_room(engine: Engine):
+    drop_duplicates(engine, "room", ["building", "room"])
+    create_index(engine, "uq_room_building_room", "room", ["building", "room"], unique=True)
+
+
+@migration
+def events_source(engine: Engine):
+    add_column(engine, "events", "source", "VARCHAR(64) NULL")
+    # The ical script always replaced the whole building, nothing else lives there
+    with engine.begin() as conn:
+        conn.execute(
+            update(table("events", column("building"), column("source")))
+            .where(column("building") == "КМО", column("source").is_(None))
+            .values(source="ical")
+        )
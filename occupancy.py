@@ -0,0 +1,108 @@
+from bisect import bisect_right
+from datetime import datetime
+
+from schedule import EventRow, ParsedEvent, parse_event, datetime_ordinal
+
+
+def room_key(building: str, room: str):
+    """Key of a room as stored in the Room table (spaces are replaced when rooms are filled)"""
+    return building, "_".join(room.split())
+
+
+class Timeline:
+    """Events of one room at one date as sorted minute arrays.
+
+    reach[i] is the latest finish among the first i+1 events, so "is anything
+    going on at t" is a single bisect no matter how events overlap.
+    """
+
+    def __init__(self, items: "list[tuple[ParsedEvent, EventRow]]", snap):
+        items = sorted(items, key=lambda item: item[0].start)
+        self.events = [event for _, event in items]
+        self.starts = [parsed.start for parsed, _ in items]
+        # snap is monotonic, so snapped starts stay sorted
+        self.snapped_starts = [snap(parsed.start) for parsed, _ in items]
+        self.finishes = [parsed.finish for parsed, _ in items]
+        self.reach = []
+        for finish in self.finishes:
+            self.reach.append(max(finish, self.reach[-1]) if self.reach else finish)
+        # Minutes at which the (snapped) busy state or the current event may change
+        self.changes = sorted(set(self.snapped_starts) | set(finish + 1 for finish in self.finishes))
+
+    def busy_at(self, minute: int, snapped=False):
+        """Event going on at minute, or None. With snapped, events start at the preceding reset time"""
+        starts = self.snapped_starts if snapped else self.starts
+        idx = bisect_right(starts, minute)
+        if idx == 0 or self.reach[idx - 1] < minute:
+            return None
+        for i in range(idx - 1, -1, -1):
+            if self.finishes[i] >= minute:
+                return self.events[i]
+
+    def next_start(self, minute: int):
+        """Start of the first event after minute, or None"""
+        idx = bisect_right(self.starts, minute)
+        return self.starts[idx] if idx < len(self.starts) else None
+
+    def next_change(self, minute: int):
+        """First minute after minute at which busy_at(snapped=True) may answer differently, or None"""
+        idx = bisect_right(self.changes, minute)
+        return self.changes[idx] if idx < len(self.changes) else None
+
+    def free_during(self, start: int, finish: int):
+        if self.busy_at(start) is not None:
+            return False
+        next_start = self.next_start(start)
+        return next_start is None or next_start > finish
+
+
+class OccupancyDay:
+    """Timelines of all rooms at one date"""
+
+    def __init__(self, timelines: "dict[tuple[str, str], Timeline]"):
+        self.timelines = timelines
+
+    def busy_at(self, building: str, room: str, minute: int, snapped=False):
+        timeline = self.timelines.get(room_key(building, room))
+        return timeline.busy_at(minute, snapped) if timeline else None
+
+    def is_free(self, building: str, room: str, minute: int, duration=0):
+        timeline = self.timelines.get(room_key(building, room))
+        return timeline is None or timeline.free_during(minute, minute + duration)
+
+    def next_change(self, building: str, room: str, minute: int):
+        timeline = self.timelines.get(room_key(building, room))
+        return timeline.next_change(minute) if timeline else None
+
+    def next_busy(self, building: str, room: str, minute: int):
+        """Start of the next event in the room after minute, or None"""
+        timeline = self.timelines.get(room_key(building, room))
+        return timeline.next_start(minute) if timeline else None
+
+
+class Occupancy:
+    """Room occupancy built from an events snapshot, per weekday, filtered by date on demand"""
+    MAX_DAYS = 32
+
+    def __init__(self, events: "list[EventRow]", snap=lambda minute: minute):
+        self.snap = snap
+        self.by_weekday: "dict[int, dict[tuple[str, str], list[tuple[ParsedEvent, EventRow]]]]" = {}
+        for event in events:
+            rooms = self.by_weekday.setdefault(event.day, {})
+            rooms.setdefault(room_key(event.building, event.room), []).append((parse_event(event), event))
+        self._days: "dict[tuple[int, int], OccupancyDay]" = {}
+
+    def day(self, date: datetime):
+        weekday = date.weekday() + 1
+        key = (datetime_ordinal(date), weekday)
+        day = self._days.get(key)
+        if day is None:
+            if len(self._days) >= self.MAX_DAYS:
+                self._days.clear()
+            timelines = {}
+            for room, items in self.by_weekday.get(weekday, {}).items():
+                items = [item for item in items if item[0].at_date(key[0])]
+                if items:
+                    timelines[room] = Timeline(items, self.snap)
+            day = self._days[key] = OccupancyDay(timelines)
+        return day
@@ -3,8 +3,13 @@ import dash_bootstrap_components as dbc
 from dash import html, dcc, Input, Output, State, callback, ALL, MATCH
 from dash import clientside_callback, no_update, callback_context, set_props
 import random
+import json
+import threading
+from flask import Response, request, redirect, url_for
 
-from utils import BUILDINGS, BUILDING_PALETTES, dbm, track_usage, ROOM_STATUS, BUILDINGS_EN, log
+from utils import BUILDINGS, BUILDING_PALETTES, dbm, track_usage, ROOM_STATUS, BUILDINGS_EN, log, server, cache
+from room_feed import RoomStatusFeed
+from sql import db
 
 dash.register_page(__name__, "/rooms")
 
@@ -56,18 +61,68 @@ def room_indexer(room: str, building: str):
     building = BUILDINGS_EN[building]
     return new_room + "_" + building
 
+# Every open stream holds a request worker, and Passenger processes serve one
+# request at a time, so streaming is opt-in (keys/ROOMS_STREAM, see utils);
+# cards are refreshed by the refresh button and the stale-data toast otherwise
+ROOMS_STREAM = server.config.get("ROOMS_STREAM", False)
+# Without streams nothing reads the feed, so it doesn't listen to marks either
+room_feed = RoomStatusFeed(dbm, cache, BUILDINGS_ROOMS) if ROOMS_STREAM else None
+# Streams end after this many seconds and EventSource reconnects, so workers are not held for long
+STREAM_LIFETIME = 30
+# Open streams per process; clients over the limit fall back to refreshing
+MAX_STREAMS = 2
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+@server.route('/rooms/stream')
+def rooms_stream():
+    if not ROOMS_STREAM:
+        # EventSource doesn't reconnect after 204
+        return Response(status=204)
+    if not dbm.verify_password(request.cookies.get('password')):
+        return redirect(url_for('request_password'))
+    # Give back the connection verify_password checked out instead of holding it while streaming
+    db.session.remove()
+    if not stream_slots.acquire(blocking=False):
+        return Response(status=204)
+
+    def events():
+        yield "retry: 3000\n\n"
+        for changes in room_feed.changes(STREAM_LIFETIME):
+            if not changes:
+                yield ": keep-alive\n\n"
+                continue
+            payload = [
+                {"index": room_indexer(room, building), "status": state.status, "desc": state.status_description}
+                for (building, room), state in changes.items()
+            ]
+            yield "data: " + json.dumps(payload, ensure_ascii=False) + "\n\n"
+
+    response = Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+def push_room_state(state):
+    set_props(
+        {"type": "room-card-store", "index": room_indexer(state.room, state.building)},
+        {"data": {"status": state.status, "desc": state.status_description}}
+    )
+    # The card no longer matches the last refresh, so the next refresh must not skip it
+    set_props("room-status-versions", {"data": {}})
+
+
 for building in BUILDINGS_ROOMS:
     @callback(
         Output(f"r-card-{building}", "children"),
         Input(f"r-card-{building}", "id")
     )
     def fill_accordion(_, building=building):
-        res = sorted(dbm.get_all_rooms(building))
-        for room in res:
-            try:
-                dbm.get_room_status(building, room)
-            except:
-                raise ValueError(f"Room {room} in building {building} is not in the database.")
+        states = dbm.get_building_statuses(building)
+        res = sorted(states)
         return [
             dbc.Row([
                 dbc.Col([
@@ -76,7 +131,8 @@ for building in BUILDINGS_ROOMS:
                             [
                                 dcc.Store(
                                     id={"type": "room-card-store", "index": room_indexer(room, building)},
-                                    data={"status": "free", "desc": "-"}, storage_type="session",
+                                    data={"status": states[room].status, "desc": states[room].status_description},
+                                    storage_type="session",
                                 ),
                                 dbc.CardHeader(
                                     room + " " + building,
@@ -172,6 +228,44 @@ clientside_callback(
 )
 
 
+# Live updates: apply status changes pushed by /rooms/stream directly to the card stores
+if ROOMS_STREAM:
+    clientside_callback(
+        """
+        function(children) {
+            if (window.roomStream || !window.EventSource) {
+                return window.dash_clientside.no_update;
+            }
+            const stream = new EventSource("/rooms/stream");
+            window.roomStream = stream;
+            stream.onopen = function() {
+                // Pushed updates replace the "stale data" reminder
+                window.dash_clientside.set_props("toast-interval", {disabled: true});
+            };
+            stream.onmessage = function(e) {
+                if (!document.getElementById("cards")) {
+                    stream.close();
+                    window.roomStream = null;
+                    return;
+                }
+                for (const change of JSON.parse(e.data)) {
+                    window.dash_clientside.set_props(
+                        {type: "room-card-store", index: change.index},
+                        {data: {status: change.status, desc: change.desc}}
+                    );
+                }
+                // Cards changed outside of the refresh callback, it must not skip them next time
+                window.dash_clientside.set_props("room-status-versions", {data: {}});
+            };
+            return true;
+        }
+        """,
+        Output("room-stream-started", "data"),
+        [Input(f"r-card-{building}", "children") for building in BUILDINGS_ROOMS],
+        prevent_initial_call=True,
+    )
+
+
 @callback(
     Output("modal", "is_open", allow_duplicate=True), 
     Input("modal-occupy", "n_clicks"),
@@ -186,7 +280,7 @@ def occupy_room(_, room, headcount, dont_come, loud):
     if not headcount:
         return False
     new_status = dbm.set_room_status(building, room, "marked", "|".join([str(headcount), ("1" if dont_come else "0"), loud]))
-    set_props({"type": "room-card-store", "index": room_indexer(room, building)}, {"data": {"status": new_status.status, "desc": new_status.status_description}})
+    push_room_state(new_status)
     return False
 
 
@@ -199,7 +293,7 @@ def occupy_room(_, room, headcount, dont_come, loud):
 def plus_one_room(_, room):
     room, building = room.split()
     new_status = dbm.room_status_plus_one(building, room)
-    set_props({"type": "room-card-store", "index": room_indexer(room, building)}, {"data": {"status": new_status.status, "desc": new_status.status_description}})
+    push_room_state(new_status)
     return False
 
 
@@ -212,7 +306,7 @@ def plus_one_room(_, room):
 def minus_one_room(_, room):
     room, building = room.split()
     new_status = dbm.room_status_minus_one(building, room)
-    set_props({"type": "room-card-store", "index": room_indexer(room, building)}, {"data": {"status": new_status.status, "desc": new_status.status_description}})
+    push_room_state(new_status)
     return False
 
 
@@ -225,7 +319,7 @@ def minus_one_room(_, room):
 def remove_mark(_, room):
     room, building = room.split()
     new_status = dbm.unmark_room(building, room)
-    set_props({"type": "room-card-store", "index": room_indexer(room, building)}, {"data": {"status": new_status.status, "desc": new_status.status_description}})
+    push_room_state(new_status)
     return False
 
 
@@ -241,28 +335,40 @@ def restart_toast(_, __):
     return False, False, 0
 
 
-# Rewrite with no MATCH
 @callback(
     Input("refresh-button", "n_clicks"),
     Input("toast-refresh", "n_clicks"),
     State({"type": "room-card-header", "index": ALL}, "children"),
     State({"type": "room-card-store", "index": ALL}, "data"),
     State({"type": "room-card-store", "index": ALL}, "id"),
+    State("room-status-versions", "data"),
 )
 @log
-def update_rooms(_, __, rooms, data, indexes):
+def update_rooms(_, __, rooms, data, indexes, versions):
+    versions = dict(versions or {})
+    cards: "dict[str, list]" = {}
     for r, d, i in zip(rooms, data, indexes):
         room, building = r.split(" ")
-        status = dbm.get_room_status(building, room)
-        if not status:
-            st = "busy"
-            ds = "Нет данных"
-        else:
-            st = status.status
-            ds = status.status_description
-        ret = {"status": st, "desc": ds}
-        if ret != d:
-            set_props(i, {'data': ret})
+        cards.setdefault(building, []).append((room, d, i))
+    statuses = dbm.get_statuses(list(cards))
+    for building, building_cards in cards.items():
+        states = statuses[building]
+        version = dbm.statuses_version(states)
+        if versions.get(building) == version:
+            continue
+        versions[building] = version
+        for room, d, i in building_cards:
+            status = states.get(room)
+            if not status:
+                st = "busy"
+                ds = "Нет данных"
+            else:
+                st = status.status
+                ds = status.status_description
+            ret = {"status": st, "desc": ds}
+            if ret != d:
+                set_props(i, {'data': ret})
+    set_props("room-status-versions", {"data": versions})
 
 
 # @callback(
@@ -439,4 +545,6 @@ layout = dbc.Container([
         dismissable=True
     ),
     dcc.Interval(id="toast-interval", interval=1000*60*3),
+    dcc.Store(id="room-status-versions", data={}, storage_type="session"),
+    dcc.Store(id="room-stream-started", data=False),
 ])
\ No newline at end of file
@@ -1,185 +1,15 @@
 import dash_bootstrap_components as dbc
 import dash
-from dash import html, dcc, Input, Output, State, callback, ALL, set_props
-import traceback
-import re
+from dash import html, dcc, Input, Output, State, callback, clientside_callback, ClientsideFunction, ALL, MATCH, set_props, no_update, callback_context
 import datetime as dtt
-import json
-import plotly.graph_objects as go
-import pandas as pd
-import plotly.express as px
 
-from utils import track_usage, dbm, cache, BUILDING_PALETTES, BUILDINGS, BUILDING_NAVIGATION, BUILDING_SECTIONS
+from utils import track_usage, dbm, BUILDING_PALETTES, BUILDINGS, BUILDING_NAVIGATION, BUILDING_SECTIONS
+from charts import get_chart_payload, CHART_CONFIG
 
 
-TIME_SLOTS = [
-    ("09:00", "10:25"),
-    ("10:45", "12:10"),
-    ("12:20", "13:45"),
-    ("13:55", "15:20"),
-    ("15:30", "16:55"),
-    ("17:05", "18:30"),
-    ("18:35", "20:00"),
-    ("20:00", "22:00"),
-]
-
 dash.register_page(__name__, "/")
 
 
-def cache_charts(key, charts: "list[go.Figure]"):
-    # Serialize the charts to JSON and store in Redis
-    try:
-        cache.set(key, [fig.to_plotly_json() for fig in charts])
-    except Exception as e:
-        return traceback.format_exc()
-
-
-def get_cached_charts(key):
-    # Retrieve the cached charts from Redis
-    cached_charts = cache.get(key)
-    if cached_charts:
-        return [dcc.Graph(figure=json.loads(fig), style={"min-width": "900px", "width": "100%"}) for fig in json.loads(cached_charts)]
-    return None
-
-
-def filter_events(events, date):
-    date_proper = dtt.datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m')
-    date_to_check = dtt.datetime.strptime(date, '%Y-%m-%d')
-    pattern = re.compile(r"\d{2}\.\d{2}")
-    pattern_between = re.compile(r"(\d{2}\.\d{2})\s*-\s*(\d{2}\.\d{2})")
-    def is_not_weekly(description, date):
-        dates = re.findall(pattern, description)
-        dates_between = re.findall(pattern_between, description)
-        for start_date, end_date in dates_between:
-            dleft = dtt.datetime.strptime(start_date, '%d.%m')
-            dright = dtt.datetime.strptime(end_date, '%d.%m')
-            if dleft <= date_to_check <= dright:
-                return True
-        if not dates:
-            return True
-        return date in dates
-    df = pd.DataFrame([
-        {'description': event.description, 'building': event.building, 'room': event.room, 'time_start': event.time_start, 'time_finish': event.time_finish}
-        for event in events 
-        if is_not_weekly(event.description, date_proper)
-    ], columns=['description', 'building', 'room', 'time_start', 'time_finish'])
-    df[['stime', 'ftime']] = df[['time_start', 'time_finish']]
-    df['time_start'] = pd.to_datetime(df['time_start'], format='%H:%M')
-    df['time_finish'] = pd.to_datetime(df['time_finish'], format='%H:%M')
-    df["description"] = df["description"].apply(lambda x: '<br>'.join(re.findall('.{1,30}(?:\\s+|$)', x)))
-    df["weekly"] = df["description"].apply(lambda x: ("False" if re.findall(pattern, x) else "True"))
-    return df
-
-NULL_PLOT = {"layout": {
-    "xaxis": {"visible": False},
-    "yaxis": {"visible": False},
-    "annotations": [{
-        "text": "На этот день<br>не запланировано мероприятий",
-        "xref": "paper",
-        "yref": "paper",
-        "showarrow": False,
-        "font": {"size": 28}
-    }]
-}}
-
-def process_room_name(room_name: str):
-    if room_name.startswith('!'):
-        return f"<b>{room_name[1:]}</b>"
-    return room_name
-
-@cache.memoize(expire=60*60*48)
-def get_event_charts(selected_date, building, theme="navy"):
-    events = dbm.get_events(selected_date)
-    filtered_df = filter_events(events, selected_date)
-    charts = generate_gantt_charts(filtered_df, building, theme)
-    return charts
-
-def generate_gantt_charts(df, building, theme="navy"):
-    df = df[df['building'] == building]
-    if df.empty:
-        return None
-    rooms = sorted(dbm.get_rooms_gantt(building))
-    room_groups = []
-    i = 0
-    for room in rooms:
-        if i % 10 == 0:
-            room_groups.append([])
-        room_groups[-1].append(room)
-        i += 1
-    df_groups = [
-        df[df["room"].isin(room_group)]
-        for room_group in room_groups
-    ]
-    for i, df_group in enumerate(df_groups):
-        for room in room_groups[i]:
-            if room not in df_group["room"].values:
-                rdf = pd.Series({
-                    "time_start":dtt.datetime.strptime("07:30", '%H:%M'),
-                    "time_finish":dtt.datetime.strptime("08:30", '%H:%M'),
-                    "description":"NaE",
-                    "stime":"07:30",
-                    "ftime":"08:30",
-                    "weekly":"True",
-                    "room":room,
-                })
-                df_groups[i] = pd.concat([df_groups[i], rdf.to_frame().T], ignore_index=True)
-    line_dash_map = {"True": "", "False": "x"}
-    figs = []
-    while len(figs) < len(room_groups):
-        try:
-            for i, df_group in enumerate(df_groups):
-                fig = px.timeline(
-                    df_group,
-                    x_start="time_start",
-                    x_end="time_finish",
-                    y="room",
-                    color="room",
-                    custom_data=["description", "stime", "ftime"],
-                    labels={"room": "Room"},
-                    color_discrete_sequence=(BUILDING_PALETTES[building] if theme == "navy" else BUILDING_PALETTES["Roomba"]),
-                    range_x=[dtt.datetime.strptime("08:30", '%H:%M'), dtt.datetime.strptime("22:30", '%H:%M')],
-                    pattern_shape="weekly",
-                    pattern_shape_map=line_dash_map,
-                    category_orders={"room": room_groups[i][::-1]},
-                )
-                ticktext = [slot[0] for slot in TIME_SLOTS] + [TIME_SLOTS[-1][1]]
-                tickvals = [dtt.datetime.strptime(tick, '%H:%M') for tick in ticktext]
-                fig.update_xaxes(
-                    tickmode="array",
-                    tickvals=tickvals,
-                    ticktext=ticktext,
-                )
-                y_labels = [process_room_name(room) for room in room_groups[i][::-1]]
-                fig.update_yaxes(
-                    categoryarray=room_groups[i][::-1],
-                    ticktext=y_labels,
-                    tickvals=room_groups[i][::-1],
-                )
-                num_rooms = len(room_groups[i])
-                fig.update_traces(hovertemplate="<b>%{y}</b><br>%{customdata[1]} - %{customdata[2]}<br><br>%{customdata[0]}<extra></extra>")
-                fig.update_layout(
-                    xaxis_title="",
-                    yaxis_title="",
-                    showlegend=False,
-                    dragmode=False,
-                    modebar_remove=["zoom", "pan", "select", "lasso", "zoomIn", "zoomOut", "autoScale", "resetScale"],
-                    margin=dict(l=20, r=20, t=40, b=20),
-                )
-                fig.update_layout(height=80 + num_rooms * 45 - (20 if num_rooms == 1 else 0))
-                for slot in TIME_SLOTS:
-                    start = pd.to_datetime(slot[0], format='%H:%M')
-                    finish = pd.to_datetime(slot[1], format='%H:%M')
-                    fig.add_vline(x=start, line=dict(color="gray", dash="dash", width=1))
-                    fig.add_vline(x=finish, line=dict(color="gray", dash="dash", width=1))
-                figs.append(fig)
-        except ValueError as e:
-            figs = []
-            # logging.error(e)
-            continue
-        else:
-            break
-    return figs
-
 @callback(
     Output("gantt-charts", "children"),
     Input("building-nav-store", "data"),
@@ -192,16 +22,15 @@ def show_gantt_charts(selection, selected_date):
         buildings = [selection]
     ret = []
     for bld in buildings:
-        figures = get_event_charts(selected_date, bld)
-        if figures:
-            if selected_date == dtt.datetime.now().strftime('%Y-%m-%d'):
-                now = dtt.datetime.strptime(dtt.datetime.now().strftime('%H:%M'), '%H:%M')
-                for chart in figures:
-                    chart: go.Figure
-                    chart.add_vline(x=now, line=dict(color="red", width=2))
-            charts = [dcc.Graph(figure=fig, style={"min-width": "900px", "width": "100%"}) for fig in figures]
-        else:
-            charts = html.H1("На этот день нет мероприятий", className="text-center text-muted m-4")
+        # Charts are requested once the card scrolls into view, see load_gantt_chart
+        charts = [
+            dcc.Store(id={"type": "gantt-visible", "index": bld}),
+            dcc.Store(id={"type": "gantt-data", "index": bld}),
+            html.Div(
+                html.P(html.Span(className="placeholder col-12", style={"height": "300px"}), className="placeholder-wave"),
+                id={"type": "gantt-chart", "index": bld}, **{"data-gantt-building": bld},
+            ),
+        ]
         ret.append(dbc.Card([
             dbc.CardHeader(
                 html.Button(
@@ -226,6 +55,68 @@ def show_gantt_charts(selection, selected_date):
     return ret
 
 
+@callback(
+    Output({"type": "gantt-data", "index": MATCH}, "data"),
+    Input({"type": "gantt-visible", "index": MATCH}, "data"),
+    State("date-picker", "date"),
+)
+def load_gantt_chart(visible, selected_date):
+    if not visible:
+        return no_update
+    bld = callback_context.triggered_id["index"]
+    return get_chart_payload(selected_date, bld) or {"building": bld, "rooms": []}
+
+
+clientside_callback(
+    ClientsideFunction(namespace="gantt", function_name="observe"),
+    Output("gantt-observer", "data"),
+    Input("gantt-charts", "children"),
+)
+
+
+clientside_callback(
+    ClientsideFunction(namespace="gantt", function_name="render"),
+    Output({"type": "gantt-chart", "index": MATCH}, "children"),
+    Input({"type": "gantt-data", "index": MATCH}, "data"),
+    State("gantt-config", "data"),
+)
+
+
+# The red "now" line is drawn in the browser, so cached figures stay the same for everyone
+clientside_callback(
+    """
+    function(_n, _charts, selectedDate) {
+        const now = new Date();
+        const pad = (n) => String(n).padStart(2, "0");
+        const today = now.getFullYear() + "-" + pad(now.getMonth() + 1) + "-" + pad(now.getDate());
+        const x = "1900-01-01 " + pad(now.getHours()) + ":" + pad(now.getMinutes());
+        const drawLine = (wrapper, attempt) => {
+            const graph = wrapper.querySelector(".js-plotly-plot");
+            if (!window.Plotly || !graph || !graph.layout) {
+                // dcc.Graph plots asynchronously, try again once it has drawn
+                if (attempt < 20) setTimeout(() => drawLine(wrapper, attempt + 1), 250);
+                return;
+            }
+            const shapes = (graph.layout.shapes || []).filter((shape) => shape.name !== "now-line");
+            if (selectedDate === today) {
+                shapes.push({
+                    name: "now-line", type: "line", x0: x, x1: x, xref: "x",
+                    y0: 0, y1: 1, yref: "y domain", line: {color: "red", width: 2},
+                });
+            }
+            window.Plotly.relayout(graph, {shapes: shapes});
+        };
+        setTimeout(() => document.querySelectorAll("#gantt-charts .dash-graph").forEach((wrapper) => drawLine(wrapper, 0)));
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("now-line-interval", "disabled"),
+    Input("now-line-interval", "n_intervals"),
+    Input({"type": "gantt-chart", "index": ALL}, "children"),
+    State("date-picker", "date"),
+)
+
+
 # @callback(
 #     Output("scripts", "children"),
 #     Input("main_header", "children"),
@@ -337,7 +228,7 @@ layout = html.Div([
                 html.P("Выберите дату чтобы проверить занятость"),
                 dcc.DatePickerSingle(
                     id='date-picker',
-                    date=pd.to_datetime('today').date(),  # Default to today's date
+                    date=dtt.date.today(),  # Default to today's date
                     display_format='YYYY-MM-DD',
                     className="mb-4",
                     first_day_of_week=1,
@@ -370,6 +261,8 @@ layout = html.Div([
                     for btn in BUILDING_NAVIGATION
                 ], style={"margin-right": "auto"}, label="Перейти к", className="my-2"),
                 dcc.Store(id="building-nav-store", data="ГК"),
+                dcc.Store(id="gantt-config", data=CHART_CONFIG),
+                dcc.Store(id="gantt-observer"),
             ], width="auto"),
         ], className="d-flex justify-content-between"),
         dbc.Row([
@@ -379,7 +272,8 @@ layout = html.Div([
                     for building in BUILDINGS
                 ], id="stores"),
                 dbc.Col(html.Div(id='gantt-charts')),
-            ], type="cube", style={"z-index": 9999, "max-height": "450px"})
+            ], type="cube", style={"z-index": 9999, "max-height": "450px"}),
+            dcc.Interval(id="now-line-interval", interval=60*1000),
         ])
     ]),
     dbc.Modal([
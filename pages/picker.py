@@ -155,22 +155,16 @@ def show_picker_results(n_clicks, building, floor, room_type, date, time, equipm
         and eq_set.issubset(room.equipment)
     ]
     free_rooms.sort(key=lambda r: r.capacity)
-    room_desc: dict[tuple[str, str], str] = {}
-    for room in free_rooms:
-        status, desc = dbm.room_status(room.building, room.room, date, time)
-        if status != "free":
-            continue
-        room_desc[(room.building, room.room)] = desc
-    
+
     return [
         dbc.Col(dbc.Card([
             dbc.CardHeader(building_span(room.building, ("" if room.room.strip("!").isdigit() else " ")+room.room.strip("!"))),
             dbc.CardBody([
                 html.P(f"Оборудование: {', '.join(room.equipment) or 'нет'}", className="mb-1"),
                 html.P(["Вместимость: ", html.Strong(str(room.capacity)), " человек"], className="mb-1"),
-                html.P(["Свободно ", room_desc[(room.building, room.room)]], className="mb-1"),
+                html.P(["Свободно ", room.free_until], className="mb-1"),
             ]),
         ]))
-        for room in free_rooms if (room.building, room.room) in room_desc
+        for room in free_rooms
     ]
         
\ No newline at end of file
@@ -1,41 +1,17 @@
-import pandas as pd
-
-data = pd.read_excel('data/schedule.xlsx', header=None)
-current_day = data.iloc[0, 1]
-weekdays = {}
-cur_start = 1
-for i, value in enumerate(data.iloc[0, 2:].fillna(0), 2):
-    if value:
-        weekdays[current_day] = (cur_start, i-1)
-        current_day = value
-        cur_start = i
-weekdays
-
-long_form = []
-for day in weekdays:
-    daydata = data.iloc[1:, weekdays[day][0]:weekdays[day][1]+1].reset_index(drop=True)
-    title = daydata.iloc[0, :].reset_index(drop=True)
-    def shorter_title(x):
-        if pd.isnull(x):
-            return x
-        spl = x.split(' ')
-        if len(spl) < 3:
-            return ' '.join(spl)
-        return spl[0]+' '+spl[1][0]+'.'+spl[2][0]+'.'
-    title_shorter = title.apply(shorter_title)
-    daydata = daydata.iloc[2:, :]
-    for col in range(daydata.shape[1]):
-        for row in range(daydata.shape[0]//2):
-            if pd.isnull(daydata.iloc[row*2, col]):
-                continue
-            event = dict(
-                description=daydata.iloc[row*2, col]+" "+title_shorter[col],
-                room=daydata.iloc[row*2+1, col],
-                teacher=title[col],
-                weekday=day,
-                slot=row
-            )
-            long_form.append(event)
+"""Faculty schedule workbook (data/schedule.xlsx) -> events of Квант and ЦЯПТ.
+
+The first sheet has a block of columns per weekday, one column per teacher:
+row 0 names the weekday over the first column of its block, row 1 has the
+teachers' full names, row 2 is a subheader, then every time slot takes two
+rows, the class and its room.
+"""
+import sys
+
+import numpy as np
+from openpyxl import load_workbook
+
+SCHEDULE_PATH = "data/schedule.xlsx"
+BUILDINGS = ["Квант", "ЦЯПТ"]
 TIME_SLOTS = [
     ("09:00", "10:25"),
     ("10:45", "12:10"),
@@ -54,13 +30,88 @@ REVERSE_WEEKDAYS = {
     'Пятница': 5,
     'Суббота': 6,
 }
-df = pd.DataFrame(long_form)
-df[['start', 'end']] = df['slot'].apply(lambda x: pd.Series(TIME_SLOTS[x]))
-df['room'] = df["room"].astype(str)
-df['room'] = df['room'].apply(lambda x: ' '.join([w for w in x.split(' ') if 'НК' not in w]))
-# df['room'].unique()
-df['building'] = df['room'].apply(lambda r: ('Квант' if r.isdigit() else 'ЦЯПТ'))
-df['day'] = df['weekday'].apply(lambda x: REVERSE_WEEKDAYS[x])
-df['time_start'] = df['start']
-df['time_finish'] = df['end']
-df[['description', 'building', 'room', 'time_start', 'time_finish', 'day']].to_csv('data/schedule.csv', index=False)
\ No newline at end of file
+
+
+def read_grid(path=SCHEDULE_PATH):
+    """Values of the first sheet as a 2D object array, empty cells None; read in streaming mode"""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = list(workbook.worksheets[0].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+    grid = np.full((len(rows), max(map(len, rows), default=0)), None, dtype=object)
+    for i, row in enumerate(rows):
+        grid[i, :len(row)] = row
+    return grid
+
+
+def shorter_title(name: str):
+    """'Фамилия Имя Отчество' -> 'Фамилия И.О.'"""
+    spl = name.split(' ')
+    if len(spl) < 3:
+        return name
+    return spl[0]+' '+spl[1][0]+'.'+spl[2][0]+'.'
+
+
+def cell_text(value):
+    # Room numbers come as numbers, sometimes as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def room_name(value):
+    return ' '.join([w for w in cell_text(value).split(' ') if 'НК' not in w])
+
+
+def schedule_events(grid: np.ndarray):
+    """Events dicts of the sheet, every column of a day block at once"""
+    if grid.shape[0] < 5:
+        return []
+    labels = grid[0]
+    # Weekday of every column: the label over its block, carried to the right
+    label_columns = np.where(np.not_equal(labels, None), np.arange(grid.shape[1]), 0)
+    label_columns[0] = 0
+    block_starts = np.maximum.accumulate(label_columns)
+    days = np.array([
+        REVERSE_WEEKDAYS.get(str(labels[col]).strip(), 0) if col else 0 for col in block_starts
+    ])
+    titles = np.array([shorter_title(str(title)) if title is not None else "" for title in grid[1]], dtype=object)
+
+    pairs = (grid.shape[0] - 3) // 2
+    classes = grid[3:3 + pairs * 2:2]
+    rooms = grid[4:4 + pairs * 2:2]
+    filled = np.not_equal(classes, None) & np.not_equal(rooms, None) & (days > 0)
+    filled[len(TIME_SLOTS):] = False
+    slot, col = np.nonzero(filled)
+    if not len(slot):
+        return []
+
+    description = np.char.strip(np.char.add(
+        np.char.add(np.vectorize(cell_text, otypes=[str])(classes[slot, col]), " "), titles[col].astype(str),
+    ))
+    # Few distinct rooms, so names are cleaned once per room
+    unique_rooms, room_index = np.unique(rooms[slot, col].astype(str), return_inverse=True)
+    room = np.array([room_name(value) for value in unique_rooms], dtype=object)[room_index]
+    building = np.where(np.char.isdigit(room.astype(str)), BUILDINGS[0], BUILDINGS[1])
+    times = np.array(TIME_SLOTS)[slot]
+    return [
+        {
+            "description": description,
+            "building": building,
+            "room": room,
+            "time_start": time_start,
+            "time_finish": time_finish,
+            "day": day,
+        }
+        for description, building, room, time_start, time_finish, day in zip(
+            description.tolist(), building.tolist(), room.tolist(),
+            times[:, 0].tolist(), times[:, 1].tolist(), days[col].tolist(),
+        )
+    ]
+
+
+if __name__ == "__main__":
+    # Same as python -m importer excel
+    from importer.cli import main
+    sys.exit(main(["excel", *sys.argv[1:]]))
@@ -0,0 +1,90 @@
+import threading
+import time
+import traceback
+
+import diskcache as dc
+
+from sql import DatabaseManager, RoomState
+
+
+class RoomStatusFeed:
+    """Latest statuses of rooms in the given buildings, for pushing to clients.
+
+    A background thread recomputes statuses right after a mark changes in this
+    process, shortly after it changes in another worker (they bump a revision
+    in the shared disk cache) and every POLL_PERIOD seconds, which catches
+    pair boundaries and the status cron.
+    """
+    POLL_PERIOD = 15
+    SHARED_CHECK_PERIOD = 0.5
+    REVISION_KEY = "rooms_revision"
+
+    def __init__(self, dbm: DatabaseManager, cache: dc.Cache, buildings: "list[str]"):
+        self.dbm = dbm
+        self.cache = cache
+        self.buildings = buildings
+        self.states: "dict[tuple[str, str], RoomState]" = {}
+        self.revision = 0
+        self._condition = threading.Condition()
+        self._dirty = threading.Event()
+        self._thread: "threading.Thread|None" = None
+        self._start_lock = threading.Lock()
+        dbm.add_rooms_listener(self.notify)
+
+    def notify(self):
+        """Called after a room status was written"""
+        self.cache.incr(self.REVISION_KEY, default=0)
+        self._dirty.set()
+
+    def _recompute(self):
+        with self.dbm.app.app_context():
+            states = {
+                (building, room): state
+                for building, rooms in self.dbm.get_statuses(self.buildings).items()
+                for room, state in rooms.items()
+            }
+        with self._condition:
+            if states != self.states:
+                self.states = states
+                self.revision += 1
+                self._condition.notify_all()
+
+    def _run(self):
+        shared_revision = self.cache.get(self.REVISION_KEY, default=0)
+        last_poll = time.monotonic()
+        while True:
+            self._dirty.wait(self.SHARED_CHECK_PERIOD)
+            current = self.cache.get(self.REVISION_KEY, default=0)
+            if not (self._dirty.is_set() or current != shared_revision
+                    or time.monotonic() - last_poll >= self.POLL_PERIOD):
+                continue
+            self._dirty.clear()
+            shared_revision = current
+            last_poll = time.monotonic()
+            try:
+                self._recompute()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._recompute()
+                self._thread = threading.Thread(target=self._run, name="room-status-feed", daemon=True)
+                self._thread.start()
+
+    def changes(self, lifetime: float, heartbeat: float = 20):
+        """Yield dicts of changed {(building, room): RoomState}, the first one with every room.
+
+        Empty dicts are yielded every heartbeat seconds so the connection stays alive.
+        """
+        self.start()
+        sent: "dict[tuple[str, str], RoomState]" = {}
+        revision = -1
+        deadline = time.monotonic() + lifetime
+        while time.monotonic() < deadline:
+            with self._condition:
+                self._condition.wait_for(lambda: self.revision != revision, timeout=heartbeat)
+                states, revision = self.states, self.revision
+            yield {key: state for key, state in states.items() if sent.get(key) != state}
+            sent = states
@@ -0,0 +1,118 @@
+import re
+from datetime import datetime
+from typing import NamedTuple
+
+
+DATE_PATTERN = re.compile(r"\d{2}\.\d{2}")
+# Admin page writes ranges as "DD.MM - DD.MM", imports as "DD.MM-DD.MM"
+DATE_RANGE_PATTERN = re.compile(r"(\d{2}\.\d{2})\s*-\s*(\d{2}\.\d{2})")
+
+
+WEEKDAYS = {
+    1: "ПН",
+    2: "ВТ",
+    3: "СР",
+    4: "ЧТ",
+    5: "ПТ",
+    6: "СБ",
+    7: "ВС",
+}
+
+
+class EventRow(NamedTuple):
+    """Detached copy of an Events row, safe to keep between requests"""
+    id: int
+    description: str
+    building: str
+    room: str
+    time_start: str
+    time_finish: str
+    day: int
+
+
+def time_to_minutes(time: str):
+    """'HH:MM' -> minutes since midnight"""
+    hours, minutes = time.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def date_ordinal(date: str):
+    """'DD.MM' -> MMDD as int, comparable within a year"""
+    day, month = date.split(".")
+    return int(month) * 100 + int(day)
+
+
+def minutes_to_time(minutes: int):
+    """minutes since midnight -> 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def datetime_ordinal(day: datetime):
+    """Same as date_ordinal, for a datetime"""
+    return day.month * 100 + day.day
+
+
+def strip_dates(description: str):
+    """Description without dates and date ranges, whitespace collapsed"""
+    no_ranges = re.sub(DATE_RANGE_PATTERN, "", description)
+    return re.sub(r"\s+", " ", re.sub(DATE_PATTERN, "", no_ranges))
+
+
+class ParsedEvent(NamedTuple):
+    """Everything the schedule logic needs from an event, parsed once"""
+    start: int
+    finish: int
+    dates: "frozenset[int]"
+    date_ranges: "tuple[tuple[int, int], ...]"
+    last_date: "int|None"
+    dateless: str
+
+    @property
+    def weekly(self):
+        return not self.dates and not self.date_ranges
+
+    def at_date(self, day: int):
+        """Whether event takes place at date (MMDD), given it's the right weekday"""
+        if self.weekly:
+            return True
+        return day in self.dates or any(left <= day <= right for left, right in self.date_ranges)
+
+
+_parsed_events: "dict[int, tuple[tuple[str, str, str], ParsedEvent]]" = {}
+
+
+def parse_event(event):
+    """Parsed representation of an event, memoized by id.
+
+    Accepts Events, EventRow or anything with the same fields. Memo entries
+    are checked against the source strings, so edited events are reparsed.
+    """
+    source = (event.description, event.time_start, event.time_finish)
+    cached = _parsed_events.get(event.id)
+    if cached is not None and cached[0] == source:
+        return cached[1]
+    description = event.description
+    date_ranges = tuple(
+        (date_ordinal(left), date_ordinal(right))
+        for left, right in re.findall(DATE_RANGE_PATTERN, description)
+    )
+    no_ranges = re.sub(DATE_RANGE_PATTERN, "", description)
+    dates = frozenset(date_ordinal(date) for date in re.findall(DATE_PATTERN, no_ranges))
+    last_date = max([
+        date_ordinal(date) for date in re.findall(DATE_PATTERN, description)
+        if not date.startswith('00') and not date.endswith('00')
+    ], default=None)
+    parsed = ParsedEvent(
+        start=time_to_minutes(event.time_start),
+        finish=time_to_minutes(event.time_finish),
+        dates=dates,
+        date_ranges=date_ranges,
+        last_date=last_date,
+        dateless=strip_dates(description),
+    )
+    _parsed_events[event.id] = (source, parsed)
+    return parsed
+
+
+def forget_parsed_events():
+    _parsed_events.clear()
@@ -0,0 +1,114 @@
+import re
+from bisect import bisect_right
+from datetime import datetime
+
+from schedule import EventRow, WEEKDAYS, time_to_minutes, datetime_ordinal, parse_event
+
+
+TIME_MENTION_PATTERN = re.compile(r"\d{1,2}:\d{2}")
+
+
+def event_tokens(event: EventRow):
+    """All words an event can be matched by: description words, room/building combos, weekday and abbreviation prefixes"""
+    room = (event.room[1:] if event.room.startswith('!') else event.room).lower()
+    building = event.building.lower()
+    tokens = set([w.lower() for w in event.description.split()] + [
+        building, room, event.description.lower(),
+        building + room,
+        room + building,
+    ])
+    tokens.add(WEEKDAYS[event.day].lower())
+    abbrv = "".join([word[0].lower() for word in event.description.split() if word.isalpha()])
+    for i in range(1, len(abbrv)):
+        tokens.add(abbrv[:i])
+    return tokens
+
+
+class SearchIndex:
+    """Inverted index over a snapshot of events, built once per snapshot.
+
+    Scores are the same as the full scan used to produce: number of query words
+    found among event words, +1 if a time from the query falls into the event,
+    +1 if the group in the query is mentioned in the description.
+    """
+
+    def __init__(self, events: "list[EventRow]"):
+        self.events = events
+        self.postings: "dict[str, list[int]]" = {}
+        self.base_tokens: "list[set[str]]" = []
+        self.last_dates: "list[int|None]" = []
+        self.times: "list[tuple[int, int]]" = []
+        self._time_hits: "dict[int, tuple[int, ...]]" = {}
+        descriptions = []
+        self.offsets: "list[int]" = []
+        offset = 0
+        for pos, event in enumerate(events):
+            tokens = event_tokens(event)
+            self.base_tokens.append(tokens)
+            for token in tokens:
+                self.postings.setdefault(token, []).append(pos)
+            parsed = parse_event(event)
+            self.last_dates.append(parsed.last_date)
+            self.times.append((parsed.start, parsed.finish))
+            description = event.description.lower()
+            descriptions.append(description)
+            self.offsets.append(offset)
+            offset += len(description) + 1
+        # All descriptions in one string: substring lookups become a single str.find pass
+        self.haystack = "\n".join(descriptions)
+
+    def _substring_hits(self, text: str):
+        """Positions of events whose lowercase description contains text"""
+        hits = set()
+        if not text:
+            return set(range(len(self.events)))
+        if "\n" in text:
+            return hits
+        start = self.haystack.find(text)
+        while start != -1:
+            pos = bisect_right(self.offsets, start) - 1
+            hits.add(pos)
+            next_offset = self.offsets[pos + 1] if pos + 1 < len(self.offsets) else len(self.haystack)
+            start = self.haystack.find(text, max(start + 1, next_offset))
+        return hits
+
+    def _events_at_time(self, minute: int):
+        if minute not in self._time_hits:
+            self._time_hits[minute] = tuple(
+                pos for pos, (start, finish) in enumerate(self.times)
+                if start <= minute <= finish
+            )
+        return self._time_hits[minute]
+
+    def query(self, query: str, extra_tokens: "set[str]|None" = None, bonus_text: "str|None" = None):
+        """Return list of (event, score) ordered by score, best first"""
+        query_word_set = set([w.lower() for w in query.split()])
+        if extra_tokens:
+            query_word_set.update(extra_tokens)
+        scores: "dict[int, int]" = {}
+        for token in query_word_set:
+            for pos in self.postings.get(token, ()):
+                scores[pos] = scores.get(pos, 0) + 1
+
+        time_matched = set()
+        for time_mention in re.findall(TIME_MENTION_PATTERN, query):
+            time_matched.update(self._events_at_time(time_to_minutes(time_mention)))
+        for pos in time_matched:
+            # Matching time counts as one more common word, unless that word was already there
+            time_start = self.events[pos].time_start
+            if time_start in query_word_set and time_start in self.base_tokens[pos]:
+                continue
+            scores[pos] = scores.get(pos, 0) + 1
+
+        for pos in self._substring_hits(query.lower()):
+            scores.setdefault(pos, 0)
+
+        bonus = self._substring_hits(bonus_text) if bonus_text else set()
+        today = datetime_ordinal(datetime.now())
+        res: "list[tuple[int, int]]" = []
+        for pos, score in scores.items():
+            if self.last_dates[pos] is not None and self.last_dates[pos] < today:
+                continue
+            res.append((pos, score + int(pos in bonus)))
+        res.sort(key=lambda x: (-x[1], x[0]))
+        return [(self.events[pos], score) for pos, score in res]
@@ -0,0 +1,99 @@
+import threading
+import time
+import traceback
+from functools import wraps
+
+import diskcache as dc
+import flask
+
+
+class SingleFlight:
+    """Cache where each missing value is computed once, across threads and worker processes.
+
+    The first caller of a missing key takes a lock (an atomic cache.add of a
+    lock key) and computes the value, the others wait for it to appear in the
+    cache. Entries stay fresh for expire seconds and are served stale for
+    another stale seconds while one caller recomputes them in the background.
+    A lock is released after lock_timeout even if its holder died.
+    """
+    LOCK_PREFIX = "single_flight_lock:"
+    POLL_PERIOD = 0.05
+
+    def __init__(self, cache: dc.Cache, app: "flask.Flask|None" = None, lock_timeout: float = 60):
+        self.cache = cache
+        self.app = app
+        self.lock_timeout = lock_timeout
+
+    def store(self, key, value, expire: float, stale: float = 0):
+        self.cache.set(key, (value, time.time() + expire), expire=expire + stale)
+
+    def _lock(self, key):
+        return self.cache.add((self.LOCK_PREFIX, key), True, expire=self.lock_timeout)
+
+    def _locked(self, key):
+        return (self.LOCK_PREFIX, key) in self.cache
+
+    def _unlock(self, key):
+        self.cache.delete((self.LOCK_PREFIX, key))
+
+    def _compute(self, key, compute, expire: float, stale: float):
+        try:
+            value = compute()
+            self.store(key, value, expire, stale)
+            return value
+        finally:
+            self._unlock(key)
+
+    def _refresh(self, key, compute, expire: float, stale: float):
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    self._compute(key, compute, expire, stale)
+            else:
+                self._compute(key, compute, expire, stale)
+        except Exception:
+            traceback.print_exc()
+
+    def get(self, key, compute, expire: float, stale: float = 0):
+        """Cached value of key, calling compute() when it's missing"""
+        entry = self.cache.get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if time.time() >= fresh_until and self._lock(key):
+                threading.Thread(
+                    target=self._refresh, args=(key, compute, expire, stale), daemon=True,
+                ).start()
+            return value
+        while not self._lock(key):
+            # Waiting only reads: every add is a write transaction on the shared cache file
+            while self._locked(key):
+                time.sleep(self.POLL_PERIOD)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    return entry[0]
+        # Someone could have stored it between our get and lock
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._unlock(key)
+            return entry[0]
+        return self._compute(key, compute, expire, stale)
+
+    def memoize(self, expire: float, stale: float = 0, method=False):
+        """Decorator version of get, keyed by function name and arguments.
+
+        With method, the first argument (self) is left out of the key.
+        wrapper.forget(*args, **kwargs) drops a cached result.
+        """
+        def decorator(func):
+            name = f"{func.__module__}.{func.__qualname__}"
+
+            def make_key(args, kwargs):
+                return (name,) + tuple(args[1:] if method else args) + tuple(sorted(kwargs.items()))
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.get(make_key(args, kwargs), lambda: func(*args, **kwargs), expire, stale)
+
+            wrapper.forget = lambda *args, **kwargs: self.cache.delete(make_key(args, kwargs))
+            return wrapper
+        return decorator
@@ -1,27 +1,54 @@
 from sqlalchemy.orm import DeclarativeBase, Session, Mapped, mapped_column
-from sqlalchemy import create_engine, select, func
-import sqlalchemy.exc as sae
+from sqlalchemy import create_engine, select, update, delete, func, or_, Index, UniqueConstraint
+from sqlalchemy.dialects import mysql, sqlite
 from datetime import datetime, timedelta
 from secrets import token_urlsafe
 from hashlib import sha256
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
 import re
-from typing import Literal
+from typing import Literal, NamedTuple, Optional
 from enum import Enum
+from functools import cached_property
+import threading
+import time
 import traceback
 
+from schedule import (
+    EventRow,
+    parse_event, forget_parsed_events, time_to_minutes, minutes_to_time, datetime_ordinal,
+)
+from search_index import SearchIndex
+from counters import CounterBuffer
+from migrations import migrate
+from occupancy import Occupancy, OccupancyDay
 
-ROOM_STATUS = Literal["free", "marked", "busy", "lecture", "computer", "chair", "lab"]
 
-DATE_PATTERN = re.compile(r"\d{2}\.\d{2}")
-DATE_RANGE_PATTERN = re.compile(r"\d{2}\.\d{2}-\d{2}\.\d{2}")
+ROOM_STATUS = Literal["free", "marked", "busy", "lecture", "computer", "chair", "lab"]
 
 RESET_TIMES = [
     "09:00", "10:25", "12:10", "13:45", "15:20", "16:55", "18:30", "20:00",
     "22:00", "00:01", "01:30", "03:00", "04:30", "06:00", "07:30"
 ]
-RESET_TIMES_DTT = [datetime.strptime(t, '%H:%M') for t in RESET_TIMES]
+RESET_MINUTES = [time_to_minutes(t) for t in RESET_TIMES]
+
+
+def next_reset(now: datetime):
+    """Moment of the first reset time after now; marks expire then"""
+    minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    later = [m for m in sorted(RESET_MINUTES) if m > minute]
+    if later:
+        return midnight + timedelta(minutes=later[0])
+    return midnight + timedelta(days=1, minutes=min(RESET_MINUTES))
+
+
+def reset_slot_start(minute: int):
+    """Start of the reset period minute falls into; marks and statuses switch at these"""
+    for i in range(len(RESET_MINUTES) - 1):
+        if RESET_MINUTES[i] <= minute < RESET_MINUTES[i + 1]:
+            return RESET_MINUTES[i]
+    return minute
 
 ROOM_TYPE = Literal["lecture", "seminar", "chair", "lab"]
 
@@ -32,16 +59,6 @@ class RoomType(Enum):
     lab = 3
     computer = 4
 
-WEEKDAYS = {
-    1: "ПН",
-    2: "ВТ",
-    3: "СР",
-    4: "ЧТ",
-    5: "ПТ",
-    6: "СБ",
-    7: "ВС",
-}
-
 PS = {
     "01": "фркт",
     "02": "лфи",
@@ -62,12 +79,13 @@ db = SQLAlchemy(model_class=Base)
 
 class Passwords(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True)
-    password_hash: Mapped[str]
-    expiration_date: Mapped[datetime]
+    password_hash: Mapped[str] = mapped_column(index=True)
+    expiration_date: Mapped[datetime] = mapped_column(index=True)
     used: Mapped[bool]
 
 
 class Events(db.Model):
+    __table_args__ = (Index("ix_events_building_room_day", "building", "room", "day"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     description: Mapped[str]
     building: Mapped[str]
@@ -75,15 +93,30 @@ class Events(db.Model):
     time_start: Mapped[str]
     time_finish: Mapped[str]
     day: Mapped[int]
+    # Importer whose events these are, e.g. "excel"; None for events added by hand
+    source: Mapped[Optional[str]] = mapped_column(default=None)
+
+
+class EventsRevision(db.Model):
+    """Single row bumped by imports, so snapshots notice updates that keep the count and max id"""
+    id: Mapped[int] = mapped_column(primary_key=True)
+    revision: Mapped[int]
+
+
+def bump_events_revision(session: Session):
+    """Increment the events revision inside the caller's transaction"""
+    if session.execute(update(EventsRevision).values(revision=EventsRevision.revision + 1)).rowcount == 0:
+        session.add(EventsRevision(id=1, revision=1))
 
 
 class Counter(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str]
+    name: Mapped[str] = mapped_column(unique=True)
     count: Mapped[int]
 
 
 class Room(db.Model):
+    __table_args__ = (UniqueConstraint("building", "room", name="uq_room_building_room"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     building: Mapped[str]
     room: Mapped[str]
@@ -92,14 +125,57 @@ class Room(db.Model):
     status_description: Mapped[str]
     capacity: Mapped[int] = mapped_column(default=9)
     equipment: Mapped[str] = mapped_column(default="")
+    marked_until: Mapped[Optional[datetime]] = mapped_column(default=None)
+
+
+class RoomState(NamedTuple):
+    """Status of a room as shown to users"""
+    building: str
+    room: str
+    status: str
+    status_description: str
+
+
+class PickerRoom(NamedTuple):
+    building: str
+    room: str
+    room_type: RoomType
+    capacity: int
+    equipment: "list[str]"
+    free_until: str
 
 
 def log_console(s):
     print(s)
 
 
+class EventsSnapshot:
+    """All events loaded at once, with lookup structures built lazily on top of them"""
+
+    def __init__(self, fingerprint: tuple, rows: "list[EventRow]"):
+        self.fingerprint = fingerprint
+        self.rows = rows
+
+    @cached_property
+    def search_index(self):
+        return SearchIndex(self.rows)
+
+    @cached_property
+    def occupancy(self):
+        return Occupancy(self.rows, snap=reset_slot_start)
+
+
 class DatabaseManager:
     EXPIRY_PERIOD = timedelta(days=5)
+    SNAPSHOT_CHECK_PERIOD = timedelta(seconds=30)
+    # verify_password answers are reused for this long (valid) or this short (invalid)
+    VERIFY_TTL = timedelta(seconds=60)
+    VERIFY_NEGATIVE_TTL = timedelta(seconds=5)
+    VERIFY_CACHE_SIZE = 10000
+    PASSWORD_CLEANUP_PERIOD = timedelta(hours=1)
+    PASSWORD_CLEANUP_BATCH = 1000
+    # Derive room statuses on read instead of relying on the status cron
+    LIVE_ROOM_STATUS = True
 
     def __init__(self, app: Flask):
         self.db = db
@@ -107,47 +183,93 @@ class DatabaseManager:
         self.app = app
         with app.app_context():
             db.create_all()
+            migrate(db.engine)
         self.logf = log_console
+        self._snapshot: "EventsSnapshot|None" = None
+        self._snapshot_checked = datetime.min
+        self._snapshot_lock = threading.Lock()
+        self._status_cache: "tuple[EventsSnapshot|None, dict]" = (None, {})
+        self._rooms_listeners = []
+        self._events_listeners = []
+        self._counters = CounterBuffer(self._write_counters)
+        self._verified: "dict[str, tuple[bool, datetime]]" = {}
+        self._verified_lock = threading.Lock()
+        self._password_cleanup: "threading.Thread|None" = None
+
+    def add_rooms_listener(self, listener):
+        """Register a function to call after room statuses are written"""
+        self._rooms_listeners.append(listener)
+
+    def _rooms_changed(self):
+        for listener in self._rooms_listeners:
+            listener()
 
     @staticmethod
     def event_temporary(event: Events):
-        dates = re.findall(DATE_PATTERN, event.description)
-        date_range = re.search(DATE_RANGE_PATTERN, event.description)
-        return bool(dates or date_range)
+        return not parse_event(event).weekly
 
     @staticmethod
     def dateless_event(event: Events):
-        res = re.sub(DATE_PATTERN, "", event.description)
-        res = re.sub(DATE_RANGE_PATTERN, "", res)
-        res = re.sub("\s+", " ", res)
-        return res
+        return parse_event(event).dateless
 
     @staticmethod
     def event_at_day(event: Events, day: datetime, weekday: int):
         if weekday != event.day:
             return False
-        date_str = day.strftime('%d.%m')
-        dates = re.findall(DATE_PATTERN, event.description)
-        date_range = re.search(DATE_RANGE_PATTERN, event.description)
-        if date_range:
-            date_start, date_finish = date_range.group().split('-')
-            start_dtt = datetime.strptime(date_start, '%d.%m')
-            finish_dtt = datetime.strptime(date_finish, '%d.%m')
-            return start_dtt <= day <= finish_dtt
-        if not dates:
-            return True
-        return date_str in dates
+        return parse_event(event).at_date(datetime_ordinal(day))
 
     @staticmethod
     def event_at_time(event: Events, time_dtt: datetime):
-        start_time = datetime.strptime(event.time_start, '%H:%M')
-        finish_time = datetime.strptime(event.time_finish, '%H:%M')
-        return start_time <= time_dtt <= finish_time
+        parsed = parse_event(event)
+        return parsed.start <= time_dtt.hour * 60 + time_dtt.minute <= parsed.finish
+
+    # EVENTS SNAPSHOT
+    def _events_fingerprint(self):
+        revision = select(func.max(EventsRevision.revision)).scalar_subquery()
+        return tuple(db.session.execute(select(func.count(Events.id), func.max(Events.id), revision)).one())
+
+    def events_snapshot(self, recheck=False):
+        """Return snapshot of the Events table, reloading it if the table has changed.
+
+        The table is checked at most once per SNAPSHOT_CHECK_PERIOD, since
+        imports run in separate processes and can't notify us directly;
+        recheck checks it now, for results that are cached beyond that period.
+        """
+        with self._snapshot_lock:
+            now = datetime.now()
+            if (not recheck and self._snapshot is not None
+                    and now - self._snapshot_checked < self.SNAPSHOT_CHECK_PERIOD):
+                return self._snapshot
+            fingerprint = self._events_fingerprint()
+            self._snapshot_checked = now
+            if self._snapshot is None or self._snapshot.fingerprint != fingerprint:
+                rows = db.session.execute(
+                    select(Events.id, Events.description, Events.building, Events.room,
+                           Events.time_start, Events.time_finish, Events.day)
+                    .order_by(Events.id)
+                ).all()
+                self._snapshot = EventsSnapshot(fingerprint, [EventRow(*row) for row in rows])
+            return self._snapshot
+
+    def invalidate_events(self, slices: "set[tuple[str, int]]|None" = None):
+        """Drop the events snapshot and notify listeners; call after writing to Events.
+
+        slices are (building, weekday) pairs that were touched, None means anything could change.
+        """
+        with self._snapshot_lock:
+            self._snapshot = None
+        forget_parsed_events()
+        for listener in self._events_listeners:
+            listener(slices)
+
+    def add_events_listener(self, listener):
+        """Register a function to call with changed (building, weekday) slices after events are written"""
+        self._events_listeners.append(listener)
 
     def add_password(self, password: Passwords):
-        self.clear_expired_passwords()
         self.db.session.add(password)
         self.db.session.commit()
+        self.forget_verification(password.password_hash)
 
     # ONE-TIME LOGIN
     def check_password(self, password: str):
@@ -168,47 +290,96 @@ class DatabaseManager:
 
     # SESSION VERIFICATION
     def verify_password(self, password: str):
+        """Whether password is a valid session; answers are cached per hash for VERIFY_TTL"""
         if password is None:
             return False
         password_hash = sha256(password.encode()).hexdigest()
+        now = datetime.now()
+        cached = self._verified.get(password_hash)
+        if cached is not None and cached[1] > now:
+            return cached[0]
         password_query = db.session.scalars(
             select(Passwords)
             .filter(Passwords.password_hash == password_hash)
-            .filter(Passwords.expiration_date > datetime.now())
+            .filter(Passwords.expiration_date > now)
         ).one_or_none()
         if password_query:
-            return True
-        return False
+            # Never past the password's own expiration
+            entry = (True, min(now + self.VERIFY_TTL, password_query.expiration_date))
+        else:
+            entry = (False, now + self.VERIFY_NEGATIVE_TTL)
+        with self._verified_lock:
+            if len(self._verified) >= self.VERIFY_CACHE_SIZE:
+                self._verified.clear()
+            self._verified[password_hash] = entry
+        return entry[0]
+
+    def forget_verification(self, password_hash: "str|None" = None):
+        """Drop cached verify_password answers of a hash, or all of them"""
+        with self._verified_lock:
+            if password_hash is None:
+                self._verified.clear()
+            else:
+                self._verified.pop(password_hash, None)
 
     # REGISTRATION
     def generate_password(self):
-        self.clear_expired_passwords()
         expiration_date = datetime.now() + self.EXPIRY_PERIOD
         password = token_urlsafe(6)
         password_hash = sha256(password.encode("utf-8")).hexdigest()
         self.db.session.add(Passwords(password_hash=password_hash, expiration_date=expiration_date, used=False))
         self.db.session.commit()
+        self.forget_verification(password_hash)
         print(password)
         return password
 
     def clear_expired_passwords(self):
-        pwd = self.db.session.execute(
-            select(Passwords)
-            .where(Passwords.expiration_date < datetime.now())
-        ).scalars().all()
-        for p in pwd:
-            self.db.session.delete(p)
-        self.db.session.commit()
+        """Delete expired passwords in batches of PASSWORD_CLEANUP_BATCH rows, return how many were deleted"""
+        now = datetime.now()
+        deleted = 0
+        while True:
+            with db.engine.begin() as conn:
+                ids = conn.scalars(
+                    select(Passwords.id)
+                    .where(Passwords.expiration_date < now)
+                    .limit(self.PASSWORD_CLEANUP_BATCH)
+                ).all()
+                if ids:
+                    conn.execute(delete(Passwords).where(Passwords.id.in_(ids)))
+            deleted += len(ids)
+            if len(ids) < self.PASSWORD_CLEANUP_BATCH:
+                break
+        # Cached answers never outlive expiration_date, so only expired entries need to go
+        with self._verified_lock:
+            self._verified = {
+                password_hash: entry for password_hash, entry in self._verified.items() if entry[1] > now
+            }
+        return deleted
+
+    def _clean_passwords(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.clear_expired_passwords()
+            except Exception:
+                traceback.print_exc()
+            time.sleep(self.PASSWORD_CLEANUP_PERIOD.total_seconds())
+
+    def start_password_cleanup(self):
+        """Run clear_expired_passwords every PASSWORD_CLEANUP_PERIOD in a background thread"""
+        with self._verified_lock:
+            if self._password_cleanup is not None:
+                return
+            self._password_cleanup = threading.Thread(target=self._clean_passwords, name="password-cleanup", daemon=True)
+        self._password_cleanup.start()
 
     def get_events(self, date: str):
         date_dtt = datetime.strptime(date, '%Y-%m-%d')
         weekday = date_dtt.weekday() + 1
-        res = self.db.session.scalars(select(Events).where(Events.day == weekday)).all()
-        return list(res)
+        return [event for event in self.events_snapshot().rows if event.day == weekday]
     
     def get_rooms_gantt(self, building: str):
-        res = self.db.session.scalars(select(Events.room).where(Events.building==building).distinct()).all()
-        return list(res)
+        return list({event.room for event in self.events_snapshot().rows if event.building == building})
 
     def get_all_rooms(self, building: str):
         res = self.db.session.scalars(select(Room.room).where(Room.building==building).distinct()).all()
@@ -222,114 +393,67 @@ class DatabaseManager:
     # SEARCH
     def get_events_by_query(self, query: str):
         """Parse search query and return ordered list of events that fully or partially match the query"""
-        all_events: "list[Events]" = db.session.scalars(select(Events)).all()
-        res: "list[tuple[Events, int]]" = []
-        query_word_set = set([w.lower() for w in query.split()])
+        extra_tokens = set()
+        text = None
         group = re.search(r"[бмс]\d\d-\d\d\d", query.lower())
-        text="&*!@$&!@^$*"
         if group:
             self.counter_plus_one("group_in_query")
             text = group.group(0)
             ps = PS[text[1:3]]
             year = str(5-int(text[4]))
-            query_word_set.update([
+            extra_tokens.update([
                 ps, year, year+"к", year+"к."
             ])
-        for event in all_events:
-            room = (event.room[1:] if event.room.startswith('!') else event.room).lower()
-            events_word_set = set([w.lower() for w in event.description.split()]
-                + [
-                    event.building.lower(), room, event.description.lower(),
-                    event.building.lower()+room,
-                    room+event.building.lower(),
-                ]
-            )
-            pattern = re.compile(r"\d{2}\.\d{2}")
-            dates = re.findall(pattern, event.description)
-            if dates:
-                today = datetime.strptime(datetime.now().strftime('%d.%m'), '%d.%m')
-                dates_dtt = [datetime.strptime(date, '%d.%m') for date in dates if not date.startswith('00') and not date.endswith('00')]
-                if dates_dtt:
-                    maxdate = max(dates_dtt)
-                    if maxdate < today:
-                        continue
-            start_time = datetime.strptime(event.time_start, '%H:%M')
-            finish_time = datetime.strptime(event.time_finish, '%H:%M')
-            time_mentions = re.findall(r'\d{1,2}:\d{2}', query)
-            for time_mention in time_mentions:
-                time_mention_dtt = datetime.strptime(time_mention, '%H:%M')
-                if start_time <= time_mention_dtt <= finish_time:
-                    query_word_set.add(event.time_start)
-                    events_word_set.add(event.time_start)
-                    break
-            events_word_set.add(WEEKDAYS[event.day].lower())
-            abbrv = "".join([word[0].lower() for word in event.description.split() if word.isalpha()])
-            for i in range(1, len(abbrv)):
-                events_word_set.add(abbrv[:i])
-            if query_word_set & events_word_set or query.lower() in event.description.lower():
-                match_count = len(query_word_set & events_word_set)
-                res.append((event, match_count + int(text in event.description.lower())))
-        res.sort(key=lambda x: x[1], reverse=True)
-        return res
+        return self.events_snapshot().search_index.query(query, extra_tokens, text)
 
     # INDEX - FREE ROOMS MODAL
-    def get_free_rooms(self, time: str, date: str):
-        date_dtt = datetime.strptime(datetime.strptime(date, '%Y-%m-%d').strftime("%d.%m"), "%d.%m")
-        weekday = datetime.strptime(date, '%Y-%m-%d').weekday() + 1
-        time_dtt = datetime.strptime(time, '%H:%M')
-        res = db.session.scalars(select(Events).where(Events.day == weekday)).all()
-        all_rooms = set([(room.room, room.building) for room in db.session.scalars(select(Room)).all()])
-        # print("\n".join(["{} {}".format(*r) for r in all_rooms]))
-        busy_rooms = set([
-            (event.room, event.building)
-            for event in res
-            if self.event_at_time(event, time_dtt) and self.event_at_day(event, date_dtt, weekday)
-        ])
-        # self.logf("\n".join([
-        #     "{} {} {}".format(event.room, event.building, event.description)
-        #     for event in res
-        #     if self.event_at_time(event, time_dtt) and self.event_at_day(event, date_dtt)
-        # ]))
+    def get_free_rooms(self, time: str, date: str, duration: int = 0):
+        """Rooms free at time (and for duration minutes after it) as sorted list of (room, building)"""
+        date_dtt = datetime.strptime(date, '%Y-%m-%d')
+        minute = time_to_minutes(time)
+        day = self.events_snapshot().occupancy.day(date_dtt)
+        all_rooms = set(db.session.execute(select(Room.room, Room.building)).tuples().all())
+        free_rooms = [
+            (room, building) for room, building in all_rooms
+            if day.is_free(building, room, minute, duration)
+        ]
         self.logf("{}".format(date_dtt.weekday() + 1))
-        return sorted(list(all_rooms - busy_rooms), key=lambda x: x[1]+x[0])
+        return sorted(free_rooms, key=lambda x: x[1]+x[0])
 
     # COUNTERS
     def counter_plus_one(self, name: str):
-        counter = db.session.scalars(select(Counter).where(Counter.name == name)).one_or_none()
-        if counter:
-            counter.count += 1
-        else:
-            db.session.add(Counter(name=name, count=1))
-        db.session.commit()
+        """Count a usage; written to the database in batches by a background thread"""
+        self._counters.add(name)
+
+    def _write_counters(self, increments: "dict[str, int]"):
+        """Add increments to Counter rows in one upsert"""
+        rows = [{"name": name, "count": count} for name, count in increments.items()]
+        with self.app.app_context():
+            if db.engine.dialect.name == "mysql":
+                stmt = mysql.insert(Counter).values(rows)
+                stmt = stmt.on_duplicate_key_update(count=Counter.count + stmt.inserted["count"])
+            else:
+                stmt = sqlite.insert(Counter).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Counter.name], set_={"count": Counter.count + stmt.excluded["count"]},
+                )
+            with db.engine.begin() as conn:
+                conn.execute(stmt)
+
+    def flush_counters(self):
+        self._counters.flush()
 
     def get_all_counters(self):
+        self.flush_counters()
         return [(c.name, c.count) for c in db.session.scalars(select(Counter)).all()]
 
     # PREPARATIONS - CREATE ROOMS
-    def fill_rooms(self):
-        with self.app.app_context():
-            Base.metadata.drop_all(bind=db.engine, tables=[Room.__table__])
-            Base.metadata.create_all(bind=db.engine, tables=[Room.__table__])
-            prevrooms = db.session.scalars(select(Room)).all()
-            if prevrooms:
-                for room in prevrooms:
-                    db.session.delete(room)
-                db.session.commit()
-            rooms = db.session.scalars(select(Events.room+" "+Events.building).distinct()).all()
-            print(len(rooms))
-            for room in rooms:
-                try:
-                    *r, b = room.split()
-                    r  = "_".join(r)
-                except ValueError:
-                    print(room)
-                    raise
-                db.session.add(Room(building=b, room=r, status="free", status_description=""))
-            db.session.commit()
-
     def external_room_status_update(self):
         with self.app.app_context():
-            self.set_room_statuses()
+            if self.LIVE_ROOM_STATUS:
+                self.clear_expired_marks()
+            else:
+                self.set_room_statuses()
 
     def get_today_events(self, room: str, building: str):
         now = datetime.now()
@@ -352,38 +476,24 @@ class DatabaseManager:
             .where(Events.room == room)
             .where(Events.building == building)
         ).all()
-        all_dates = set()
-        if date:
-            all_dates.add(date)
-            if date_end:
-                begin_dtt = datetime.strptime(date, '%Y-%m-%d')
-                end_dtt = datetime.strptime(date_end, '%Y-%m-%d')
-                cur_dtt = begin_dtt
-                while cur_dtt < end_dtt:
-                    cur_dtt += timedelta(days=7)
-                    all_dates.add(cur_dtt.strftime('%Y-%m-%d'))
-        time_start_dtt = datetime.strptime(time_start, '%H:%M')
-        time_finish_dtt = datetime.strptime(time_finish, '%H:%M')
-        flag = False
+        all_days = set()
+        if not forever:  # forever collides with weekly events and dated ones not over yet
+            end_dtt = datetime.strptime(date_end, '%Y-%m-%d') if date_end else day_dtt
+            cur_dtt = day_dtt
+            while cur_dtt <= end_dtt:
+                all_days.add(datetime_ordinal(cur_dtt))
+                cur_dtt += timedelta(days=7)
+        start = time_to_minutes(time_start)
+        finish = time_to_minutes(time_finish)
         for event in all_events:
-            start_time = datetime.strptime(event.time_start, '%H:%M')
-            finish_time = datetime.strptime(event.time_finish, '%H:%M')
-            dates = re.findall(DATE_PATTERN, event.description)
-            date_range = re.search(DATE_RANGE_PATTERN, event.description)
-            if all_dates:  # skips on specific dates uncollisions
-                # either date_range or dates expected. If both are present, the logic is flawed
-                if date_range:  # skips on date ranges uncollisions
-                    date_start, date_finish = date_range.group().split('-')
-                    start_dtt = datetime.strptime(date_start, '%d.%m')
-                    finish_dtt = datetime.strptime(date_finish, '%d.%m')
-                    if begin_dtt > finish_dtt or end_dtt < start_dtt:
-                        continue
-                if dates and not set(dates) & all_dates:
+            parsed = parse_event(event)
+            if all_days and not any(parsed.at_date(day) for day in all_days):
+                continue
+            if forever and not parsed.weekly:
+                last_day = max([parsed.last_date or 0, *(right for _, right in parsed.date_ranges)])
+                if last_day < datetime_ordinal(day_dtt):
                     continue
-            if flag:
-                print(start_time, finish_time, time_start_dtt, time_finish_dtt)
-                flag = False
-            if start_time <= time_start_dtt < finish_time or start_time < time_finish_dtt <= finish_time:
+            if parsed.start <= start < parsed.finish or parsed.start < finish <= parsed.finish:
                 return event
         return None
     
@@ -397,187 +507,214 @@ class DatabaseManager:
             .where(Events.room == room)
             .where(Events.building == building)
         ).all()
-        all_events = sorted(all_events, key=lambda x: datetime.strptime(x.time_start, "%H:%M"))
+        all_events = sorted(all_events, key=lambda x: parse_event(x).start)
         return [ev for ev  in all_events if self.event_at_day(ev, day_dtt, weekday)]
     
     def room_status(self, building: str, room: str, date: str, time: str):
+        day = self.events_snapshot().occupancy.day(datetime.strptime(date, '%Y-%m-%d'))
+        return self.room_status_at(day, building, room, time_to_minutes(time))
+
+    def room_status_at(self, day: OccupancyDay, building: str, room: str, minute: int):
         MAX_LEN=45
-        day_dtt = datetime.strptime(date, '%Y-%m-%d')
-        bad_day = day_dtt.strftime('%d.%m')
-        bad_day_dtt = datetime.strptime(bad_day, '%d.%m')
-        weekday = day_dtt.weekday() + 1
-        time_dtt = datetime.strptime(time, '%H:%M')
-        room_events = db.session.scalars(
-            select(Events)
-            .where(Events.room == room or Events.room == room.strip("!"))
-            .where(Events.building == building)
-            .where(Events.day == weekday)
-        ).all()
-        events_to_check = []
-        for event in room_events:
-            start_time = datetime.strptime(event.time_start, '%H:%M')
-            for i in range(len(RESET_TIMES_DTT) - 1):
-                if RESET_TIMES_DTT[i] <= start_time < RESET_TIMES_DTT[i + 1]:
-                    start_time = RESET_TIMES_DTT[i]
-                    break
-            finish_time = datetime.strptime(event.time_finish, '%H:%M')
-            dates = re.findall(DATE_PATTERN, event.description)
-            date_range = re.search(DATE_RANGE_PATTERN, event.description)
-            if date_range:
-                date_start, date_finish = date_range.group().split('-')
-                start_dtt = datetime.strptime(date_start, '%d.%m')
-                finish_dtt = datetime.strptime(date_finish, '%d.%m')
-                if not start_dtt <= bad_day_dtt <= finish_dtt:
-                    continue
-            if dates and bad_day not in dates:
-                continue
-            events_to_check.append(event)
-            if start_time <= time_dtt <= finish_time:
-                status = "busy"
-                long_description = "..." if len(event.description) > MAX_LEN else ""
-                status_description = event.description[:MAX_LEN] + long_description
-                break
-        else:
-            start_times = sorted([datetime.strptime(event.time_start, '%H:%M') for event in events_to_check])
-            closest = None
-            for st in start_times:
-                if st <= time_dtt:
-                    continue
-                closest = st
-                break
-            desc = "до " + closest.strftime('%H:%M') if closest else "до конца дня"
-            status_description = desc
-            status = "free"
-        return status, status_description
+        event = day.busy_at(building, room, minute, snapped=True)
+        if event is not None:
+            long_description = "..." if len(event.description) > MAX_LEN else ""
+            return "busy", event.description[:MAX_LEN] + long_description
+        return "free", self.free_until_description(day.next_busy(building, room, minute))
+
+    @staticmethod
+    def free_until_description(next_busy: "int|None"):
+        return "до " + minutes_to_time(next_busy) if next_busy is not None else "до конца дня"
 
     # CRON - UPDATE ROOMS STATUS
     def set_room_statuses(self):
-        rooms = db.session.scalars(select(Room)).all()
-        now = datetime.strptime(datetime.now().strftime('%H:%M'), '%H:%M')
-        today = datetime.today().strftime("%Y-%m-%d")
-        today_dtt = datetime.today()
-        for room in rooms:
-            status, description = self.room_status(room.building, room.room, today, now.strftime('%H:%M'))
-            if status == "free" and room.room_type.name != "seminar":
-                status = room.room_type.name
-            room.status = status
-            room.status_description = description
+        """Recompute status of every room in one pass and write back only changed rows"""
+        now = datetime.now()
+        minute = now.hour * 60 + now.minute
+        day = self.events_snapshot().occupancy.day(now)
+        rooms = db.session.execute(
+            select(Room.id, Room.building, Room.room, Room.room_type, Room.status, Room.status_description)
+        ).all()
+        changes = []
+        for room_id, building, room, room_type, old_status, old_description in rooms:
+            status, description = self.room_status_at(day, building, room, minute)
+            if status == "free" and room_type.name != "seminar":
+                status = room_type.name
+            if (status, description) != (old_status, old_description):
+                changes.append({"id": room_id, "status": status, "status_description": description})
+        if changes:
+            db.session.execute(update(Room), changes)
         db.session.commit()
+        if changes:
+            self._rooms_changed()
+        return len(changes)
+
+    # ROOMS - LIVE STATUS
+    def _schedule_status(self, building: str, room: str, room_type: RoomType, now: datetime):
+        """Status of a room by the timetable alone, cached until the timetable can change it"""
+        snapshot = self.events_snapshot()
+        if self._status_cache[0] is not snapshot:
+            self._status_cache = (snapshot, {})
+        cache = self._status_cache[1]
+        key = (building, room, room_type)
+        cached = cache.get(key)
+        if cached is not None and cached[0] <= now < cached[1]:
+            return cached[2], cached[3]
+        minute = now.hour * 60 + now.minute
+        day = snapshot.occupancy.day(now)
+        status, description = self.room_status_at(day, building, room, minute)
+        if status == "free" and room_type.name != "seminar":
+            status = room_type.name
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        change = day.next_change(building, room, minute)
+        valid_until = midnight + (timedelta(minutes=change) if change is not None else timedelta(days=1))
+        cache[key] = (midnight + timedelta(minutes=minute), valid_until, status, description)
+        return status, description
+
+    def room_state(self, room: Room, now: "datetime|None" = None):
+        """Current status of a room: unexpired mark if any, timetable status otherwise"""
+        if not self.LIVE_ROOM_STATUS:
+            return RoomState(room.building, room.room, room.status, room.status_description)
+        now = now or datetime.now()
+        if room.status == "marked" and room.marked_until is not None and now < room.marked_until:
+            return RoomState(room.building, room.room, "marked", room.status_description)
+        status, description = self._schedule_status(room.building, room.room, room.room_type, now)
+        return RoomState(room.building, room.room, status, description)
+
+    def clear_expired_marks(self):
+        """Drop marks that have outlived their pair; reads already ignore them, this only tidies the table"""
+        res = db.session.execute(
+            update(Room)
+            .where(Room.status == "marked")
+            .where(or_(Room.marked_until == None, Room.marked_until <= datetime.now()))
+            .values(status="free", status_description="", marked_until=None)
+        )
+        db.session.commit()
+        if res.rowcount:
+            self._rooms_changed()
 
     def get_room_statuses(self):
-        return db.session.scalars(select(Room)).all()
+        now = datetime.now()
+        return [self.room_state(room, now) for room in db.session.scalars(select(Room)).all()]
 
-    # ROOMS - CARD UPDATES - STATUS
-    def get_room_status(self, building: str, room: str):
-        all_roooms = self.get_all_rooms(building)
-        if room not in all_roooms:
-            raise ValueError("Room not found")
+    def _get_room(self, building: str, room: str):
         return db.session.scalars(
             select(Room)
             .where(Room.building == building)
             .where(Room.room == room)
-        ).one_or_none()
+        ).one()
 
-    def set_room_status(self, building: str, room: str, status: ROOM_STATUS, description: str):
-        room_status = db.session.scalars(
+    # ROOMS - CARD UPDATES - STATUS
+    def get_room_status(self, building: str, room: str):
+        room_row = db.session.scalars(
             select(Room)
             .where(Room.building == building)
             .where(Room.room == room)
-        ).one()
-        if room_status.status != "free":
+        ).one_or_none()
+        if room_row is None:
+            raise ValueError("Room not found")
+        return self.room_state(room_row)
+
+    def get_building_statuses(self, building: str):
+        """Statuses of all rooms of a building in one query, as {room: RoomState}"""
+        return self.get_statuses([building]).get(building, {})
+
+    def get_statuses(self, buildings: "list[str]"):
+        """Statuses of all rooms of the buildings in one query, as {building: {room: RoomState}}"""
+        now = datetime.now()
+        rooms = db.session.scalars(select(Room).where(Room.building.in_(buildings))).all()
+        res: "dict[str, dict[str, RoomState]]" = {building: {} for building in buildings}
+        for room in rooms:
+            res[room.building][room.room] = self.room_state(room, now)
+        return res
+
+    @staticmethod
+    def statuses_version(states: "dict[str, RoomState]"):
+        """Short digest of building statuses; equal digests mean no card has to change"""
+        digest = sha256()
+        for room in sorted(states):
+            digest.update("|".join(states[room]).encode())
+            digest.update(b"\n")
+        return digest.hexdigest()[:16]
+
+    def set_room_status(self, building: str, room: str, status: ROOM_STATUS, description: str):
+        room_row = self._get_room(building, room)
+        if self.room_state(room_row).status != "free":
             raise ValueError("Room is busy or lecture, cannot change status")
-        room_status.status = status
-        room_status.status_description = description
+        room_row.status = status
+        room_row.status_description = description
+        room_row.marked_until = next_reset(datetime.now())
         db.session.commit()
-        return room_status
+        self._rooms_changed()
+        return self.room_state(room_row)
 
     def room_status_plus_one(self, building: str, room: str):
-        room_status = db.session.scalars(
-            select(Room)
-            .where(Room.building == building)
-            .where(Room.room == room)
-        ).one()
-        if room_status.status != "marked":
+        room_row = self._get_room(building, room)
+        if self.room_state(room_row).status != "marked":
             raise ValueError("Room is busy, free or lecture, cannot change status")
-        desc = room_status.status_description
+        desc = room_row.status_description
         plim, unav, loud = desc.split("|")
         plim = str(int(plim) + 1)
         desc = f"{plim}|{unav}|{loud}"
-        room_status.status_description = desc
+        room_row.status_description = desc
         db.session.commit()
-        return room_status
+        self._rooms_changed()
+        return self.room_state(room_row)
 
     def room_status_minus_one(self, building: str, room: str):
-        room_status = db.session.scalars(
-            select(Room)
-            .where(Room.building == building)
-            .where(Room.room == room)
-        ).one()
-        if room_status.status != "marked":
+        room_row = self._get_room(building, room)
+        if self.room_state(room_row).status != "marked":
             raise ValueError("Room is busy, free or lecture, cannot change status")
-        desc = room_status.status_description
+        desc = room_row.status_description
         plim, unav, loud = desc.split("|")
         plim = str(int(plim) - 1)
         if plim == "0":
-            room_status = self.unmark_room(building, room)
-            return room_status
+            return self.unmark_room(building, room)
         desc = f"{plim}|{unav}|{loud}"
-        room_status.status_description = desc
+        room_row.status_description = desc
         db.session.commit()
-        return room_status
+        self._rooms_changed()
+        return self.room_state(room_row)
 
     def unmark_room(self, building: str, room: str):
         now = datetime.now()
-        now_t = datetime.strptime(now.strftime('%H:%M'), '%H:%M')
-        events_starts = db.session.scalars(
-            select(Events.time_start)
-            .where(Events.room == room)
-            .where(Events.building == building)
-            .where(Events.day == now.weekday() + 1)
-        ).all()
-        room_status = db.session.scalars(
-            select(Room)
-            .where(Room.building == building)
-            .where(Room.room == room)
-        ).one()
-        if room_status.status != "marked":
+        room_row = self._get_room(building, room)
+        if self.room_state(room_row, now).status != "marked":
             print("Error")
             raise ValueError("Room is busy or lecture, cannot change status")
-        start_times = sorted([datetime.strptime(st, '%H:%M') for st in events_starts])
-        for st in start_times:
-            if st <= now_t:
-                continue
-            closest = st
-            break
-        else:
-            closest = None
-        desc = "до " + closest.strftime('%H:%M') if closest else "до конца дня"
-        room_status.status_description = desc
-        room_status.status = "free"
+        day = self.events_snapshot().occupancy.day(now)
+        room_row.status_description = self.free_until_description(
+            day.next_busy(building, room, now.hour * 60 + now.minute)
+        )
+        room_row.status = "free"
+        room_row.marked_until = None
         db.session.commit()
+        self._rooms_changed()
+        room_status = self.room_state(room_row, now)
         print(room_status.status, room_status.status_description)
         return room_status
     
     # PICKER - FREE ROOMS
     def get_free_rooms_picker(self, building: str, room_type: str, date: str, time: str):
-        free_rooms = self.get_free_rooms(time, date) # list of tuples (room, building)
-        ret_rooms: list[Room] = []
-        for rid, bid in free_rooms:
-            if building != "any" and building != bid:
-                continue
-            try:
-                room = db.session.scalars(
-                    select(Room)
-                    .where(Room.building == bid)
-                    .where(Room.room == rid)
-                ).all()[0]
-            except KeyError:
-                print("No results found: {} {}".format(bid, rid))
-                continue
-            if room.room_type.name != room_type:
+        """Rooms of room_type free at date and time, with description of how long they stay free"""
+        minute = time_to_minutes(time)
+        day = self.events_snapshot().occupancy.day(datetime.strptime(date, '%Y-%m-%d'))
+        query = (
+            select(Room.building, Room.room, Room.room_type, Room.capacity, Room.equipment)
+            .where(Room.room_type == RoomType[room_type])
+        )
+        if building != "any":
+            query = query.where(Room.building == building)
+        ret_rooms: "list[PickerRoom]" = []
+        for bid, rid, rtype, capacity, equipment in db.session.execute(query):
+            # Rooms count as busy since the start of the pair, same as on /rooms
+            if day.busy_at(bid, rid, minute, snapped=True) is not None:
                 continue
-            ret_rooms.append(room)
-        self.db.session.expunge_all()
+            ret_rooms.append(PickerRoom(
+                building=bid, room=rid, room_type=rtype, capacity=capacity,
+                equipment=[eq for eq in equipment.split(",") if eq],
+                free_until=self.free_until_description(day.next_busy(bid, rid, minute)),
+            ))
         return ret_rooms
 
     def get_room_equipment(self, building: str):
@@ -1,7 +1,11 @@
 from functools import wraps
-from sql import DatabaseManager, ROOM_STATUS, WEEKDAYS
+from sql import DatabaseManager, ROOM_STATUS
+from schedule import WEEKDAYS
 import flask
 import diskcache as dc
+from single_flight import SingleFlight
+from metrics import Metrics
+import time
 import traceback
 from dash import html
 
@@ -73,8 +77,17 @@ with open("keys/SQL") as f:
     sql_url = f.read().strip()
 server.config['SQLALCHEMY_DATABASE_URI'] = sql_url
 server.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Push room statuses to the free rooms page over /rooms/stream. Every open
+# stream holds a Passenger worker, so it's off unless keys/ROOMS_STREAM says "True"
+try:
+    with open("keys/ROOMS_STREAM") as f:
+        server.config['ROOMS_STREAM'] = f.read().strip() == "True"
+except FileNotFoundError:
+    server.config['ROOMS_STREAM'] = False
 server.secret_key = "MyNameIsNotDiana"
 dbm = DatabaseManager(server)
+single_flight = SingleFlight(cache, server)
+metrics = Metrics()
 
 
 def building_span(building, addition=""):
@@ -89,6 +102,10 @@ def track_usage(name):
         @wraps(func)
         def wrapper(*args, **kwargs):
             dbm.counter_plus_one(name)
-            return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
         return wrapper
     return decorator
\ No newline at end of file
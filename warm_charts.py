@@ -0,0 +1,11 @@
+import sys
+from utils import dbm
+from charts import warm_charts, invalidate_charts, DEFAULT_WARM_DAYS
+
+# Run right after schedule imports: rebuilds charts for the next days
+# and drops the rest, so no one waits for a chart built from old events
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WARM_DAYS
+    with dbm.app.app_context():
+        warmed = warm_charts(days)
+        invalidate_charts(keep=warmed)